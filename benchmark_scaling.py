@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de escala: tempo e memória de uma geração em função do tamanho da paisagem.
+
+Para cada L mede-se a construção do índice de vizinhança (R = 3), o passo de uma geração
+(capacidade de suporte, Lotka-Volterra, breque, migração e campo médio para as duas
+espécies), os eventos de distúrbio aleatório e de invasão, e o custo por proposta do
+distúrbio agregado. O pico de memória da geração é medido com tracemalloc.
+
+Uso:
+    python benchmark_scaling.py --sizes 50 100 200 500 1000 2000
+    DISTURBANCE_BACKEND=numpy python benchmark_scaling.py --migration-mode individual
+
+Resultado de referência com a migração 'multinomial' (o padrão de --migration-mode; 1
+núcleo; tempos em s, memória em MB; as colunas µs/patch e B/patch ficam constantes, ou
+seja, tempo e memória crescem linearmente com o número de patches). O pico de memória não
+inclui o índice de vizinhança, que ocupa cerca de 29 x (4 + 4) bytes por patch com R = 3,
+e, no backend 'numba', os arrays alocados dentro dos kernels, que o tracemalloc não vê.
+A migração 'individual' (um sorteio por patch, em Python) custa de 11 a 15 µs por patch.
+
+backend 'numba':
+
+       L   patches   índice   geração  µs/patch  MB geração  B/patch  distúrbio  invasão  agregado µs/prop
+      50      2500    0.002     0.001     0.502         0.2       89      0.000    0.000               0.1
+     100     10000    0.007     0.002     0.236         0.9       88      0.000    0.000               0.1
+     200     40000    0.040     0.013     0.335         3.5       88      0.001    0.001               0.1
+     500    250000    0.199     0.079     0.314        22.0       88      0.003    0.004               0.4
+    1000   1000000    0.892     0.325     0.325        88.0       88      0.011    0.015               0.6
+    2000   4000000    4.029     1.319     0.330       352.0       88      0.055    0.094               0.8
+
+backend 'numpy':
+
+       L   patches   índice   geração  µs/patch  MB geração  B/patch  distúrbio  invasão  agregado µs/prop
+      50      2500    0.002     0.001     0.225         1.4      555      0.000    0.000               2.9
+     100     10000    0.008     0.002     0.193         5.5      555      0.000    0.000               3.5
+     200     40000    0.036     0.012     0.297        22.2      554      0.001    0.001               3.7
+     500    250000    0.207     0.092     0.368       138.4      554      0.003    0.004               4.4
+    1000   1000000    0.893     0.474     0.474       553.9      554      0.010    0.016               6.5
+    2000   4000000    4.213     1.975     0.494      2215.9      554      0.043    0.102               8.0
+
+"""
+
+import argparse
+import functools
+import time
+import tracemalloc
+
+import numpy as np
+from numpy.random import default_rng
+
+import events
+import neighbors
+
+
+def measure(function, *args, repeat=1, memory=False):
+    """
+    executa function e retorna (resultado, tempo médio em s, pico de memória em bytes)
+
+    uma primeira execução, não cronometrada, carrega os kernels compilados (e o cache de
+    __pycache__) antes das execuções cronometradas; o pico de memória vem de uma execução
+    extra com tracemalloc (que atrasa laços em Python), também separada
+    """
+
+    function(*args)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def generation(rng, landscape, native_population, exotic_population, neighbor_index, migration_mode='multinomial',
+               migration_rate=0.2, alfa=0.8, beta=0.8, r_n=1, r_e=1):
+    """ passo de uma geração dos cenários, sem eventos """
+
+    kn_array = events.kn_update(landscape)
+    ke_array = events.ke_update(landscape)
+
+    native_population = events.lotka_volterra(native_population, exotic_population, r_n, alfa, kn_array)
+    exotic_population = events.lotka_volterra(exotic_population, native_population, r_e, beta, ke_array)
+
+    native_population = events.breque(native_population)
+    exotic_population = events.breque(exotic_population)
+
+    nat_migrantes = events.calc_migrantes(native_population, migration_rate)
+    exo_migrantes = events.calc_migrantes(exotic_population, migration_rate)
+
+    native_population = events.migracao(rng, nat_migrantes, native_population, neighbor_index, migration_mode)
+    exotic_population = events.migracao(rng, exo_migrantes, exotic_population, neighbor_index, migration_mode)
+
+    native_population = events.remove_migrantes(native_population, nat_migrantes)
+    exotic_population = events.remove_migrantes(exotic_population, exo_migrantes)
+
+    _, native_population = events.campo_medio(native_population)
+    _, exotic_population = events.campo_medio(exotic_population)
+
+    return native_population, exotic_population
+
+
+def run(L, R=3, p=0.5, q00=0.9, proposals=1000000, seed=12456789, migration_mode='multinomial'):
+    """ mede todas as etapas para uma paisagem L x L """
+
+    rng = default_rng(seed)
+    neighbor_index, index_time, _ = measure(neighbors.build_neighbor_index, L, R)
+
+    landscape = np.full((L, L), 2, dtype=int)
+    landscape, disturbance_time, _ = measure(events.random_disturbance, rng, landscape, p)
+
+    native_population = np.full((L, L), 500, dtype=float)
+    exotic_population = np.zeros((L, L), dtype=float)
+    exotic_population, invasion_time, _ = measure(events.invasion, rng, landscape, exotic_population, 1000)
+
+    _, generation_time, generation_peak = measure(
+        generation, rng, landscape, native_population, exotic_population, neighbor_index, migration_mode,
+        repeat=3, memory=True)
+
+    # custo por proposta do gerador de Hiebeler, descontando a preparação (sem a parada por paciência)
+    _, setup_time, _ = measure(events.clustered_disturbance, default_rng(seed),
+                               np.full((L, L), 2, dtype=int), p, q00, neighbor_index, 0)
+    stats = {}
+    _, clustered_time, _ = measure(functools.partial(events.clustered_disturbance, patience=0, stats=stats),
+                                   default_rng(seed), np.full((L, L), 2, dtype=int), p, q00, neighbor_index, proposals)
+
+    return {
+        'L': L,
+        'patches': L * L,
+        'index_time': index_time,
+        'generation_time': generation_time,
+        'generation_peak': generation_peak,
+        'disturbance_time': disturbance_time,
+        'invasion_time': invasion_time,
+        'proposal_time': (clustered_time - setup_time) / max(stats['iterations'], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--proposals', type=int, default=1000000)
+    parser.add_argument('--migration-mode', default='multinomial', choices=events.MIGRATION_MODES)
+    args = parser.parse_args()
+
+    print(f"{'L':>8}{'patches':>10}{'índice':>9}{'geração':>10}{'µs/patch':>10}{'MB geração':>12}"
+          f"{'B/patch':>9}{'distúrbio':>11}{'invasão':>9}{'agregado µs/prop':>18}")
+
+    for L in args.sizes:
+        result = run(L, proposals=args.proposals, migration_mode=args.migration_mode)
+        print(f"{result['L']:>8}{result['patches']:>10}{result['index_time']:>9.3f}"
+              f"{result['generation_time']:>10.3f}{1e6 * result['generation_time'] / result['patches']:>10.3f}"
+              f"{result['generation_peak'] / 1e6:>12.1f}{result['generation_peak'] / result['patches']:>9.0f}"
+              f"{result['disturbance_time']:>11.3f}{result['invasion_time']:>9.3f}"
+              f"{1e6 * result['proposal_time']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
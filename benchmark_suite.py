@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Suíte de benchmarks dos eventos e dos cenários, com comparação contra uma referência.
+
+Cada caso mede o tempo médio (e, com --memory, o pico de memória) de um evento de
+events.py para vários tamanhos de paisagem, taxas de migração e tamanhos de população,
+ou de uma execução completa de scenario_1 a scenario_4 (relatada em gerações/s). Os
+resultados podem ser gravados como referência (--save) e comparados com ela: casos
+mais lentos (ou com mais memória) que a referência além de --threshold são marcados
+e o programa termina com código 1.
+
+Uso:
+    python benchmark_suite.py --save                # grava a referência
+    python benchmark_suite.py                       # compara com a referência
+    python benchmark_suite.py --quick --filter migracao
+
+As referências dependem da máquina: grave uma por máquina (--baseline arquivo.json).
+
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+from numpy.random import default_rng
+
+import events
+import neighbors
+from benchmark_scaling import measure
+
+# arquivo padrão das referências
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# aumento relativo de tempo ou memória a partir do qual um caso é marcado
+THRESHOLD = 0.25
+
+# tempo mínimo cronometrado por caso, em s (casos rápidos são repetidos), e número de rodadas
+MIN_TIME = 0.5
+ROUNDS = 5
+
+# grades de parâmetros (completa e --quick); 'float32' nos cenários usa também a paisagem int8
+GRIDS = {
+    'full': {'sizes': (50, 200, 500), 'migration_rates': (0.05, 0.2, 0.5), 'populations': (10, 500, 5000),
+             'scenario_sizes': (50, 200), 'clustered': (False, True), 'precisions': ('float64', 'float32'),
+             'generations': 50, 'iterations': 100000},
+    'quick': {'sizes': (50, 200), 'migration_rates': (0.2,), 'populations': (500,),
+              'scenario_sizes': (50,), 'clustered': (False,), 'precisions': ('float64',), 'generations': 20,
+              'iterations': 20000},
+}
+
+R = 3
+
+
+def state(L, population=500, p=0.5, seed=12456789):
+    """ paisagem disturbada e populações de referência para os casos de eventos """
+
+    rng = default_rng(seed)
+    landscape = events.random_disturbance(rng, np.full((L, L), 2, dtype=int), p)
+    native_population = np.full((L, L), float(population))
+    exotic_population = events.invasion(rng, landscape, np.zeros((L, L)), population)
+
+    return landscape, native_population, exotic_population
+
+
+def event_cases(grid):
+    """ casos (nome, parâmetros, função sem argumentos) dos eventos, para todos os tamanhos """
+
+    return [case for L in grid['sizes'] for case in size_cases(L, grid)]
+
+
+def size_cases(L, grid):
+    """ casos dos eventos para uma paisagem L x L """
+
+    neighbor_index = neighbors.cached_neighbor_index(L, R)
+    landscape, native_population, exotic_population = state(L)
+    kn_array = events.kn_update(landscape)
+    rng = default_rng(L)
+    size = {'L': L}
+
+    cases = [
+        ('kn_update', size, lambda: events.kn_update(landscape)),
+        ('lotka_volterra', size,
+         lambda: events.lotka_volterra(native_population, exotic_population, 1, 0.8, kn_array)),
+        ('breque', size, lambda: events.breque(native_population - 499.9995)),
+        ('calc_migrantes', size, lambda: events.calc_migrantes(native_population, 0.2)),
+        ('remove_migrantes', size, lambda: events.remove_migrantes(native_population, native_population * 0.2)),
+        ('campo_medio', size, lambda: events.campo_medio(native_population)),
+        ('random_disturbance', size, lambda: events.random_disturbance(rng, landscape, 0.5)),
+        ('restoration', size, lambda: events.restoration(rng, landscape, 0.2)),
+        ('clustered_disturbance', {**size, 'iterations': grid['iterations']},
+         lambda: events.clustered_disturbance(rng, np.full((L, L), 2, dtype=int), 0.5, 0.9,
+                                              neighbor_index, grid['iterations'])),
+        ('checkerboard_disturbance', {**size, 'iterations': grid['iterations']},
+         lambda: events.checkerboard_disturbance(rng, np.full((L, L), 2, dtype=int), 0.5, 0.9,
+                                                 neighbor_index, grid['iterations'])),
+    ]
+
+    for individuals in (1000, 1000000):
+        cases.append(('invasion', {**size, 'individuals': individuals},
+                      lambda individuals=individuals: events.invasion(rng, landscape, np.zeros((L, L)), individuals)))
+
+    for population in grid['populations']:
+        for rate in grid['migration_rates']:
+            pop = np.full((L, L), float(population))
+            migrantes = events.calc_migrantes(pop, rate)
+            for mode in events.MIGRATION_MODES:
+                # o modo individual (laço em Python) só nas paisagens menores
+                if mode == 'individual' and L > 200:
+                    continue
+                cases.append(('migracao', {**size, 'population': population, 'rate': rate, 'mode': mode},
+                              lambda pop=pop, migrantes=migrantes, mode=mode: events.migracao(
+                                  rng, migrantes, pop.copy(), neighbor_index, mode)))
+
+    return cases
+
+
+def scenario_cases(grid):
+    """ casos das execuções completas dos cenários """
+
+    arguments = {1: {}, 2: {'pr': 0.2, 'rec_time': 5}, 3: {'pr': 0.2, 'rec_time': 5, 'dist_time': 5},
+                 4: {'pr': 0.2, 'rec_time': 5, 'total_dist': 5}}
+    generations = grid['generations']
+    cases = []
+
+    for number, scenario_arguments in arguments.items():
+        module = importlib.import_module(f'cenário_{number}')
+        function = getattr(module, f'scenario_{number}')
+        for L, clustered, precision in itertools.product(grid['scenario_sizes'], grid['clustered'],
+                                                         grid['precisions']):
+            params = {'L': L, 'generations': generations, 'clustered': clustered}
+            extra = dict(scenario_arguments)
+            if precision != 'float64':
+                params['precision'] = precision
+                extra.update(population_dtype=precision, landscape_dtype='int8')
+            cases.append((f'scenario_{number}', params,
+                          lambda function=function, L=L, clustered=clustered, extra=extra:
+                          function(p=0.5, native_migration_rate=0.2, exotic_migration_rate=0.2,
+                                   inicial_disturbance_clustered=clustered, q00=0.9 if clustered else None,
+                                   matrix_size=(L, L), total_num_generations=generations,
+                                   **extra)))
+
+    return cases
+
+
+def case_name(name, params):
+    return f"{name}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+
+def run_case(function, memory=False):
+    """
+    tempo em s e pico de memória em bytes de uma chamada
+
+    o tempo é o menor entre ROUNDS rodadas, cada uma repetindo a chamada até MIN_TIME / ROUNDS,
+    para reduzir o ruído de outros processos da máquina
+    """
+
+    _, elapsed, _ = measure(function)
+    repeat = max(1, int(MIN_TIME / ROUNDS / max(elapsed, 1e-9)))
+    rounds = [measure(function, repeat=repeat)[1] for _ in range(ROUNDS if elapsed < MIN_TIME else 1)]
+    peak = measure(function, memory=True)[2] if memory else None
+
+    return min(rounds), peak
+
+
+def run_suite(grid, pattern=None, memory=False, scenarios=True):
+    """
+    executa a suíte
+
+    Returns
+    -------
+    results : dict
+        {nome do caso: {'time': s, 'peak': bytes ou None, 'gens_per_s': apenas cenários}}
+
+    """
+
+    cases = event_cases(grid)
+    if scenarios:
+        cases += scenario_cases(grid)
+
+    results = {}
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        # os cenários gravam output_scenarioN.npz no diretório atual
+        os.chdir(scratch)
+        try:
+            for name, params, function in cases:
+                key = case_name(name, params)
+                if pattern is not None and pattern not in key:
+                    continue
+                elapsed, peak = run_case(function, memory)
+                results[key] = {'time': elapsed, 'peak': peak}
+                if name.startswith('scenario_'):
+                    results[key]['gens_per_s'] = params['generations'] / elapsed
+                print(report_line(key, results[key]), flush=True)
+        finally:
+            os.chdir(workdir)
+
+    return results
+
+
+def report_line(key, result, reference=None, flag=''):
+    line = f"{key:<72}{1e3 * result['time']:>12.3f} ms"
+    if 'gens_per_s' in result:
+        line += f"{result['gens_per_s']:>10.1f} ger/s"
+    if result['peak'] is not None:
+        line += f"{result['peak'] / 1e6:>10.1f} MB"
+    if reference is not None:
+        line += f"{result['time'] / reference['time']:>8.2f}x {flag}"
+
+    return line
+
+
+def environment():
+    """ descrição da máquina e das versões, gravada com a referência """
+
+    return {'platform': platform.platform(), 'processor': platform.processor(), 'python': sys.version.split()[0],
+            'numpy': np.__version__, 'backend': events.BACKEND, 'date': time.strftime('%Y-%m-%d')}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    compara os resultados com a referência
+
+    Returns
+    -------
+    regressions : list of str
+        casos mais lentos, ou com mais memória, que a referência além de threshold
+
+    """
+
+    regressions = []
+
+    for key, result in results.items():
+        reference = baseline['results'].get(key)
+        if reference is None:
+            continue
+
+        slower = result['time'] > (1 + threshold) * reference['time']
+        larger = (result['peak'] is not None and reference.get('peak') is not None
+                  and result['peak'] > (1 + threshold) * reference['peak'])
+        flag = ' '.join(label for label, hit in (('LENTO', slower), ('MEMÓRIA', larger)) if hit)
+        print(report_line(key, result, reference, flag))
+        if flag:
+            regressions.append(key)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='grade reduzida')
+    parser.add_argument('--filter', default=None, help='só os casos cujo nome contém o texto')
+    parser.add_argument('--memory', action='store_true', help='mede também o pico de memória')
+    parser.add_argument('--no-scenarios', action='store_true')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help='grava os resultados como referência')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    grid = GRIDS['quick' if args.quick else 'full']
+    results = run_suite(grid, args.filter, args.memory, not args.no_scenarios)
+
+    if args.save:
+        baseline = {'environment': environment(), 'results': results}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as handle:
+                stored = json.load(handle)
+            baseline['results'] = {**stored['results'], **results}
+        with open(args.baseline, 'w') as handle:
+            json.dump(baseline, handle, indent=1, sort_keys=True)
+        print(f"referência gravada em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"sem referência em {args.baseline}; use --save para gravar")
+        return 0
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    print(f"\ncomparação com {args.baseline} ({baseline['environment']['date']}), limite +{args.threshold:.0%}")
+    regressions = compare(results, baseline, args.threshold)
+    print(f"{len(regressions)} regressões")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
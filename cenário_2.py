@@ -1,20 +1,31 @@
 # -*- coding: utf-8 -*-
+"""
+Cenário 2: Invasão Biológica em Paisagens Pós-Distúrbio que Passam por Eventos de Restauração
 
-import numpy as np
-from numpy.random import default_rng
-import pickle
-import events
+Exemplos:
+    python cenário_2.py --pr 0.2 --rec-time 5
+    python cenário_2.py --pr 0.2 --rec-time 5 --checkpoint estado.npz
+    python cenário_2.py --checkpoint estado.npz --resume
+    python cenário_2.py --pr 0.2 --rec-time 5 --clustered --q00 1.0
+    python cenário_2.py --pr 0.2 --rec-time 5 --clustered --q00 1.0 --clustered-method gaussian
+    python cenário_2.py --pr 0.2 --rec-time 5 --migration-mode mean_field
+
+"""
 
-# informações dos vizinhos (L = 50, R = 3)
-with open('neighbors_L=50_R=3.txt', 'rb') as handle:
-    neighbors_info = pickle.loads(handle.read())
+import numpy as np
+import simulation
+from streams import RandomStreams
 
 
 def scenario_2(p, pr, rec_time, native_migration_rate, exotic_migration_rate,
                inicial_disturbance_clustered=False, q00=None,
                matrix_size=(50, 50), total_num_generations=100, alfa=0.8, beta=0.8, r_n=1, r_e=1,
                inicial_native_population=500, inicial_patch_quality=2,
-               exotic_individuals_to_introduce=1000, seed=12456789):
+               exotic_individuals_to_introduce=1000, migration_mode='individual',
+               output_dir=None, grid_stride=1, mean_stride=1, seed=12456789,
+               landscape_library=None, termination=None, profiler=None,
+               checkpoint_path=None, checkpoint_every=10, population_dtype=float, landscape_dtype=int,
+               packed_landscape=False, clustered_options=None, clustered_method='hiebeler'):
     """
     Cenário 2: Invasão Biológica em Paisagens Pós-Distúrbio que Passam por Eventos de Restauração
 
@@ -50,7 +61,7 @@ def scenario_2(p, pr, rec_time, native_migration_rate, exotic_migration_rate,
         Nível de correlação entre os patches disturbados. Necessário caso inicial_disturbance_clustered=True.
         
     matrix_size : (int, int)
-        Tamanho da paisagem. Por enquanto só funciona com (50, 50).
+        Tamanho da paisagem (L, L). The default is (50, 50).
         
     total_num_generations : int, optional
         Número total de gerações. The default is 100.
@@ -76,8 +87,64 @@ def scenario_2(p, pr, rec_time, native_migration_rate, exotic_migration_rate,
     exotic_individuals_to_introduce : integer or real, optional
         Número de indivíduos da sp. exótica que serão introduzidos na invasão biológica. The default is 1000.
     
-    seed : int, optional
-        Seed para gerar números pseudo-aleatórios. The default is 12456789.
+    migration_mode : str, optional
+        Modo da migração, 'multinomial' ou 'individual' (sorteios) ou 'mean_field' (determinística, os
+        migrantes divididos igualmente entre os vizinhos; ver events.migracao). The default is 'individual'.
+    
+    output_dir : str, optional
+        Diretório onde o histórico é gravado em disco durante a execução (ver history.StreamingWriter).
+        The default is None, que mantém o histórico em memória e o salva em output_scenario2.npz ao final.
+    
+    grid_stride : int, optional
+        Com output_dir, intervalo de gerações entre as grades gravadas. The default is 1.
+    
+    mean_stride : int, optional
+        Com output_dir, intervalo de gerações entre as médias gravadas. The default is 1.
+    
+    seed : int or sequence of int, optional
+        Seed para gerar números pseudo-aleatórios, com um fluxo independente por tipo de evento
+        (ver streams.RandomStreams). The default is 12456789.
+        Com uma sequência de seeds, uma réplica por seed é simulada em lote (modo ensemble; ver
+        simulation.simulate) e cada array do histórico ganha um eixo inicial de réplicas.
+    
+    landscape_library : str or LandscapeLibrary, optional
+        Biblioteca de paisagens agregadas (ver landscapes.py): com inicial_disturbance_clustered=True,
+        a paisagem inicial de cada seed é lida da biblioteca ou gerada e guardada nela.
+        The default is None (a paisagem é sempre gerada com o gerador da simulação).
+    
+    termination : str, optional
+        Término antecipado na extinção das duas espécies ou no estado estacionário, 'stop' ou
+        'fast_forward' (ver simulation.simulate). The default is None (simula todas as gerações).
+    
+    profiler : profiling.Profiler, optional
+        Mede o tempo (e as alocações) de cada etapa de cada geração. The default is None.
+    
+    checkpoint_path : str, optional
+        Arquivo onde o estado da simulação é gravado a cada checkpoint_every gerações; a simulação
+        interrompida continua com simulation.resume(checkpoint_path). The default is None.
+    
+    checkpoint_every : int, optional
+        Intervalo de gerações entre os checkpoints. The default is 10.
+    
+    population_dtype : dtype or str, optional
+        Tipo das populações, 'float64' ou 'float32' (ver precision.py). The default is float.
+    
+    landscape_dtype : dtype or str, optional
+        Tipo inteiro da paisagem, por exemplo 'int8'. The default is int.
+    
+    packed_landscape : bool, optional
+        Se a paisagem do histórico é gravada com 2 bits por patch (ver history.pack_landscape).
+        The default is False.
+    
+    clustered_options : dict, optional
+        Controle do gerador agregado: iterations, patience, temperature, cooling e boundary_bias
+        (ver events.clustered_disturbance) e, com 'checkerboard', workers e blocks. The default is None.
+    
+    clustered_method : str, optional
+        Gerador do distúrbio inicial agregado (com inicial_disturbance_clustered=True): 'hiebeler',
+        'checkerboard', o mesmo gerador em paralelo por subredes (ver events.checkerboard_disturbance),
+        ou 'gaussian', campo gaussiano limiarizado, muito mais rápido em paisagens grandes
+        (ver events.gaussian_disturbance). The default is 'hiebeler'.
 
     Returns
     -------
@@ -100,85 +167,42 @@ def scenario_2(p, pr, rec_time, native_migration_rate, exotic_migration_rate,
         Vetor com todas as gerações
 
     """
-    rng = rng = default_rng(seed)
-
-    # t = 0    
-    restoration_counter = 0
-    landscape = np.full(matrix_size, inicial_patch_quality, dtype=int)
-    native_population = np.full(matrix_size, inicial_native_population, dtype=float)
-    exotic_population = np.zeros(matrix_size, dtype=float)
-    
-    # store
-    stored_mean_nat = np.array([np.mean(native_population)])
-    stored_mean_exo = np.array([np.mean(exotic_population)])
-    stored_natpop = np.array([native_population])
-    stored_exopop = np.array([exotic_population])
-    stored_landscape = np.array([landscape])
-    stored_generations = np.array([0])
-
-    for gen in range(1, total_num_generations):
-        # counters
-        restoration_counter += 1
-        
-        # atualizar capacidade de suporte
-        kn_array = events.kn_update(landscape)
-        ke_array = events.ke_update(landscape)
-
-        # lotka
-        native_population = events.lotka_volterra(
-            native_population, exotic_population, r_n, alfa, kn_array)
-        exotic_population = events.lotka_volterra(
-            exotic_population, native_population, r_e, beta, ke_array)
-        
-        # breque
-        native_population = events.breque(native_population)
-        exotic_population = events.breque(exotic_population)
-        
-        # calcular migrantes
-        nat_migrantes = events.calc_migrantes(native_population, native_migration_rate)
-        exo_migrantes = events.calc_migrantes(exotic_population, exotic_migration_rate)
-               
-        # migração
-        native_population = events.migracao(rng, nat_migrantes, native_population, neighbors_info)
-        exotic_population = events.migracao(rng, exo_migrantes, exotic_population, neighbors_info)
-        
-        # remover migrantes
-        native_population = events.remove_migrantes(native_population, nat_migrantes)
-        exotic_population = events.remove_migrantes(exotic_population, exo_migrantes)
-        
-        # t = 1
-        if gen == 1:
-            # distúrbio inicial
-            if inicial_disturbance_clustered:
-                landscape = events.clustered_disturbance(rng, landscape, p, q00, neighbors_info)
-            else:
-                landscape = events.random_disturbance(rng, landscape, p)
-            
-            # invasão
-            exotic_population = events.invasion(rng, landscape, 
-                                                exotic_population, exotic_individuals_to_introduce)
-         
-        # restoration
-        if restoration_counter == rec_time:
-            landscape = events.restoration(rng, landscape, pr)
-            restoration_counter = 0
-        
-        # campo médio
-        nat_cm, native_population = events.campo_medio(native_population)
-        exo_cm, exotic_population = events.campo_medio(exotic_population)
-        
-        # store
-        stored_mean_nat = np.append(stored_mean_nat, [nat_cm], axis=0)
-        stored_mean_exo = np.append(stored_mean_exo, [exo_cm], axis=0)
-        stored_natpop = np.append(stored_natpop, [native_population], axis=0)
-        stored_exopop = np.append(stored_exopop, [exotic_population], axis=0)
-        stored_landscape = np.append(stored_landscape, [landscape], axis=0)
-        stored_generations = np.append(stored_generations, [gen], axis=0)
-    
-    np.savez('output_scenario2.npz', stored_mean_nat, stored_mean_exo,
-             stored_natpop, stored_exopop, stored_landscape, stored_generations)
-
-# Exemplos:
-scenario_2(p=0.5, pr=0.2, rec_time=5, native_migration_rate=0.2, exotic_migration_rate=0.2)
-scenario_2(p=0.5, pr=0.2, rec_time=5, native_migration_rate=0.2, exotic_migration_rate=0.2,
-           q00=1.0, inicial_disturbance_clustered=True)
+    ensemble = np.ndim(seed) > 0
+    rngs = [RandomStreams(replicate_seed) for replicate_seed in (seed if ensemble else [seed])]
+
+    # t = 1: distúrbio inicial e invasão; a cada rec_time: restauração
+    schedule = simulation.scenario_schedule(2, rngs[0]['schedule'], total_num_generations, rec_time=rec_time)
+
+    rng = rngs if ensemble else rngs[0]
+    simulation.simulate(rng, schedule, p, native_migration_rate, exotic_migration_rate, pr=pr,
+                        inicial_disturbance_clustered=inicial_disturbance_clustered, q00=q00,
+                        matrix_size=matrix_size, total_num_generations=total_num_generations,
+                        alfa=alfa, beta=beta, r_n=r_n, r_e=r_e,
+                        inicial_native_population=inicial_native_population,
+                        inicial_patch_quality=inicial_patch_quality,
+                        exotic_individuals_to_introduce=exotic_individuals_to_introduce,
+                        migration_mode=migration_mode, output_file='output_scenario2.npz',
+                        output_dir=output_dir, grid_stride=grid_stride, mean_stride=mean_stride,
+                        landscape_library=landscape_library, landscape_seed=seed,
+                        termination=termination, profiler=profiler,
+                        checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+                        population_dtype=population_dtype, landscape_dtype=landscape_dtype,
+                        packed_landscape=packed_landscape, clustered_options=clustered_options,
+                        clustered_method=clustered_method)
+
+
+def main():
+    parser = simulation.scenario_parser(__doc__.strip().splitlines()[0], q00=1.0)
+    parser.add_argument('--pr', type=float, default=0.2, help='intensidade da restauração')
+    parser.add_argument('--rec-time', type=int, default=5, help='intervalo entre restaurações')
+    args = parser.parse_args()
+
+    if args.resume:
+        simulation.resume(args.checkpoint)
+        return
+
+    scenario_2(pr=args.pr, rec_time=args.rec_time, **simulation.scenario_arguments(args))
+
+
+if __name__ == '__main__':
+    main()
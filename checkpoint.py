@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints de simulações em andamento (ver simulation.simulate e simulation.resume).
+
+Um checkpoint é um .npz com o estado completo da simulação ao fim de uma geração:
+populações, paisagem, campos médios, estado do término antecipado, os contadores do
+histórico (o histórico em memória fica em segmentos no diretório {path}.history, um por
+checkpoint, e o histórico em disco nos arquivos do StreamingWriter), os argumentos da
+simulação, os cronogramas e o estado do gerador de cada réplica (rng.bit_generator.state,
+ou o de cada fluxo de um streams.RandomStreams). A simulação retomada de um checkpoint
+é idêntica, bit a bit, à simulação sem interrupção.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+from streams import RandomStreams
+
+
+def rng_state(rng):
+    """ estado serializável (JSON) de um Generator ou RandomStreams """
+
+    if isinstance(rng, RandomStreams):
+        return {'streams': rng.state()}
+
+    return rng.bit_generator.state
+
+
+def restore_rng(state):
+    """ Generator ou RandomStreams no estado state (ver rng_state) """
+
+    if 'streams' in state:
+        return RandomStreams.from_state(state['streams'])
+
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state
+
+    return np.random.Generator(bit_generator)
+
+
+def save_checkpoint(path, arrays, info):
+    """
+    grava um checkpoint de forma atômica (arquivo temporário e os.replace)
+
+    Parameters
+    ----------
+    path : str
+        arquivo .npz do checkpoint
+
+    arrays : dict
+        {nome: numpy array}
+
+    info : dict
+        valores serializáveis em JSON (argumentos, contadores, estados dos geradores); escalares
+        e arrays do numpy são convertidos com tolist
+
+    """
+
+    temp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(temp_path, **arrays, info=json.dumps(info, default=lambda value: value.tolist()))
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """ lê um checkpoint gravado por save_checkpoint, retornando (arrays, info) """
+
+    with np.load(path) as stored:
+        arrays = {name: stored[name] for name in stored.files if name != 'info'}
+        info = json.loads(str(stored['info']))
+
+    return arrays, info
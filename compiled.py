@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+kernels compilados com Numba (opcional) para os laços de migração e do gerador de
+Hiebeler (serial e por subredes)
+
+Os kernels usam o gerador interno do Numba, semeado a cada chamada com um inteiro
+sorteado do Generator do chamador: para uma mesma seed os resultados são
+reprodutíveis, mas diferentes (com a mesma distribuição) dos obtidos pelo caminho
+em NumPy. Sem o Numba instalado, AVAILABLE é False e os eventos usam apenas NumPy.
+
+O Numba só é importado, e cada kernel só é compilado (ou lido do cache em
+__pycache__), na primeira chamada: importar este módulo não tem custo.
+"""
+
+import functools
+import importlib.util
+
+import numpy as np
+
+AVAILABLE = importlib.util.find_spec('numba') is not None
+
+
+def jit(function=None, nogil=False):
+    """ compila function com numba.njit na primeira chamada; nogil libera o GIL durante o kernel """
+
+    if function is None:
+        return functools.partial(jit, nogil=nogil)
+
+    kernel = None
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        nonlocal kernel
+        if kernel is None:
+            import numba
+            kernel = numba.njit(cache=True, nogil=nogil)(function)
+        return kernel(*args)
+
+    return wrapper
+
+
+def seed_from(rng):
+    """ sorteia, com o Generator do chamador, a seed do gerador interno de um kernel """
+
+    return int(rng.integers(2 ** 32, dtype=np.uint32))
+
+
+@jit
+def migrate(seeds, quanta, offsets, targets, quantum_factor):
+    """
+    chegadas de grupos de migrantes em cada patch de um lote de réplicas
+
+    quanta tem shape (n_replicates, n_patches) e o gerador é semeado com seeds[i] antes
+    da réplica i: cada réplica recebe as mesmas chegadas de uma chamada só com ela.
+    Cada patch com poucos grupos (até quantum_factor por vizinho) sorteia um vizinho
+    por grupo; os demais dividem os grupos entre os vizinhos por binomiais
+    condicionais (multinomial uniforme).
+    """
+
+    arrivals = np.zeros(quanta.shape, dtype=np.int64)
+
+    for replicate in range(quanta.shape[0]):
+        np.random.seed(seeds[replicate])
+
+        for patch in range(quanta.shape[1]):
+            remaining = quanta[replicate, patch]
+            if remaining == 0:
+                continue
+
+            start = offsets[patch]
+            degree = offsets[patch + 1] - start
+
+            if remaining <= quantum_factor * degree:
+                for _ in range(remaining):
+                    arrivals[replicate, targets[start + np.random.randint(0, degree)]] += 1
+            else:
+                for slot in range(degree):
+                    if slot == degree - 1:
+                        sent = remaining
+                    else:
+                        sent = np.random.binomial(remaining, 1.0 / (degree - slot))
+                    arrivals[replicate, targets[start + slot]] += sent
+                    remaining -= sent
+                    if remaining == 0:
+                        break
+
+    return arrivals
+
+
+@jit
+def hiebeler(seed, disturbed, landscape, pair_offsets, pair_targets, mixed, target, counts, iterations, patience,
+             temperature, cooling, boundary_bias):
+    """
+    laço de trocas do gerador de Hiebeler sobre arrays planos (ver events.clustered_disturbance)
+
+    disturbed (uint8), landscape e mixed (vizinhos de outro estado) são atualizados no
+    lugar; retorna as contagens finais de blocos 00/02/22, o número de trocas aceitas e
+    o número de propostas feitas.
+    """
+
+    np.random.seed(seed)
+    n_patches = disturbed.size
+    count_00, count_02, count_22 = counts[0], counts[1], counts[2]
+    d = abs(target[0] - count_00) + abs(target[1] - count_02) + abs(target[2] - count_22)
+    best_d = d
+    since_best = 0
+    accepted = 0
+    performed = 0
+
+    # conjunto dos patches de borda com remoção em O(1): members[where[patch]] == patch
+    members = np.empty(n_patches, dtype=np.int64)
+    where = np.full(n_patches, -1, dtype=np.int64)
+    size = 0
+    for patch in range(n_patches):
+        if mixed[patch] > 0:
+            members[size] = patch
+            where[patch] = size
+            size += 1
+
+    while performed < iterations and d > 0 and (patience <= 0 or since_best < patience):
+        performed += 1
+        u_bias = np.random.random()
+        u_patch = np.random.random()
+        u_accept = np.random.random()
+        if size > 0 and u_bias < boundary_bias:
+            patch = members[int(u_patch * size)]
+        else:
+            patch = int(u_patch * n_patches)
+
+        start, stop = pair_offsets[patch], pair_offsets[patch + 1]
+        zeros = 0
+        for position in range(start, stop):
+            zeros += disturbed[pair_targets[position]]
+        others = stop - start - zeros
+
+        # cada par vizinho é contado nos dois sentidos
+        if disturbed[patch]:
+            temp_00 = count_00 - 2 * zeros
+            temp_02 = count_02 + 2 * zeros - 2 * others
+            temp_22 = count_22 + 2 * others
+        else:
+            temp_00 = count_00 + 2 * zeros
+            temp_02 = count_02 - 2 * zeros + 2 * others
+            temp_22 = count_22 - 2 * others
+
+        temp_d = abs(target[0] - temp_00) + abs(target[1] - temp_02) + abs(target[2] - temp_22)
+
+        if temperature > 0:
+            accept = temp_d < d or u_accept < np.exp((d - temp_d) / temperature)
+            temperature *= cooling
+        else:
+            accept = temp_d < d
+
+        if accept:
+            disturbed[patch] ^= 1
+            count_00, count_02, count_22, d = temp_00, temp_02, temp_22, temp_d
+            landscape[patch] = 1 if landscape[patch] == 0 else 0
+            accepted += 1
+
+            # bordas: o patch troca de lado em relação a todos os vizinhos
+            mixed[patch] = stop - start - mixed[patch]
+            for position in range(start - 1, stop):
+                cell = patch if position < start else pair_targets[position]
+                if position >= start:
+                    mixed[cell] += 1 if disturbed[cell] != disturbed[patch] else -1
+                if mixed[cell] > 0 and where[cell] < 0:
+                    members[size] = cell
+                    where[cell] = size
+                    size += 1
+                elif mixed[cell] == 0 and where[cell] >= 0:
+                    last = members[size - 1]
+                    members[where[cell]] = last
+                    where[last] = where[cell]
+                    where[cell] = -1
+                    size -= 1
+
+        if d < best_d:
+            best_d = d
+            since_best = 0
+        else:
+            since_best += 1
+
+    return np.array([count_00, count_02, count_22]), accepted, performed
+
+
+@jit(nogil=True)
+def checkerboard_block(seed, disturbed, landscape, pair_offsets, pair_targets, cells, share, proposals, temperature,
+                       boundary_bias):
+    """
+    trocas do gerador de Hiebeler em um bloco de patches de uma mesma subrede (ver
+    events.checkerboard_disturbance)
+
+    Os patches de cells não são vizinhos entre si: as trocas só leem vizinhos de outra
+    subrede, que não mudam durante a fase, e os blocos rodam em threads sem conflito.
+    Uma troca é aceita se aproxima as variações de blocos 00/02/22 do bloco da sua parte
+    share do que falta para os blocos desejados. disturbed (uint8) e landscape são
+    atualizados no lugar; retorna as variações das contagens, o número de trocas aceitas e
+    o número de propostas feitas.
+    """
+
+    np.random.seed(seed)
+    delta_00, delta_02, delta_22 = 0, 0, 0
+    d = abs(share[0]) + abs(share[1]) + abs(share[2])
+    accepted = 0
+    performed = 0
+
+    # patches de borda do bloco (com algum vizinho de outro estado), fixos durante a fase
+    boundary = np.empty(cells.size, dtype=np.int64)
+    size = 0
+    for patch in cells:
+        for position in range(pair_offsets[patch], pair_offsets[patch + 1]):
+            if disturbed[pair_targets[position]] != disturbed[patch]:
+                boundary[size] = patch
+                size += 1
+                break
+
+    while performed < proposals and d > 0:
+        performed += 1
+        if size > 0 and np.random.random() < boundary_bias:
+            patch = boundary[np.random.randint(0, size)]
+        else:
+            patch = cells[np.random.randint(0, cells.size)]
+
+        start, stop = pair_offsets[patch], pair_offsets[patch + 1]
+        zeros = 0
+        for position in range(start, stop):
+            zeros += int(disturbed[pair_targets[position]])
+        others = stop - start - zeros
+
+        if disturbed[patch]:
+            temp_00 = delta_00 - 2 * zeros
+            temp_02 = delta_02 + 2 * zeros - 2 * others
+            temp_22 = delta_22 + 2 * others
+        else:
+            temp_00 = delta_00 + 2 * zeros
+            temp_02 = delta_02 - 2 * zeros + 2 * others
+            temp_22 = delta_22 - 2 * others
+
+        temp_d = abs(share[0] - temp_00) + abs(share[1] - temp_02) + abs(share[2] - temp_22)
+
+        if temperature > 0:
+            accept = temp_d < d or np.random.random() < np.exp((d - temp_d) / temperature)
+        else:
+            accept = temp_d < d
+
+        if accept:
+            disturbed[patch] ^= 1
+            delta_00, delta_02, delta_22, d = temp_00, temp_02, temp_22, temp_d
+            landscape[patch] = 1 if landscape[patch] == 0 else 0
+            accepted += 1
+
+    return np.array([delta_00, delta_02, delta_22]), accepted, performed
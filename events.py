@@ -1,10 +1,45 @@
 # -*- coding: utf-8 -*-
 
+import array
+import os
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
 import numpy as np
 
+import compiled
+import neighbors
+
+
+# backend dos laços de migração e do gerador de Hiebeler: 'numba' (kernels
+# compilados, ver compiled.py) quando o Numba está instalado, senão 'numpy'; pode ser
+# fixado pela variável de ambiente DISTURBANCE_BACKEND
+BACKEND = os.environ.get('DISTURBANCE_BACKEND', 'numba' if compiled.AVAILABLE else 'numpy')
+
+
+# distribuição normal padrão, usada na calibração do campo gaussiano
+NORMAL = NormalDist()
+
+
+def use_compiled(backend=None):
+    """ indica se os kernels compilados devem ser usados com o backend pedido (None: BACKEND) """
+
+    backend = BACKEND if backend is None else backend
+
+    if backend not in ('numba', 'numpy'):
+        raise ValueError(f"backend desconhecido: {backend}")
+    if backend == 'numba' and not compiled.AVAILABLE:
+        raise ImportError("o backend 'numba' requer o pacote numba")
 
-@np.vectorize
-def kn_update(landscape):
+    return backend == 'numba'
+
+
+# capacidade de suporte indexada pela qualidade do patch (0, 1, 2)
+KN_TABLE = np.array([500, 1000, 1000])
+KE_TABLE = np.array([1000, 1000, 500])
+
+
+def kn_update(landscape, dtype=None):
     """
     retorna a capacidade de suporte da sp. nativa de acordo com a qualidade dos patches
 
@@ -13,6 +48,9 @@ def kn_update(landscape):
     landscape : numpy array
         array contendo a qualidade da paisagem
 
+    dtype : dtype, optional
+        tipo do resultado, o mesmo das populações. The default is None (inteiro).
+
     Returns
     -------
     kn : numpy array
@@ -20,17 +58,12 @@ def kn_update(landscape):
 
     """
 
-    if landscape == 2 or landscape == 1:
-        kn = 1000
+    table = KN_TABLE if dtype is None else KN_TABLE.astype(dtype)
 
-    elif landscape == 0:
-        kn = 500
+    return table[landscape]
 
-    return kn
 
-
-@np.vectorize
-def ke_update(landscape):
+def ke_update(landscape, dtype=None):
     """
     retorna a capacidade de suporte da espécie exótica de acordo com a qualidade do patch
 
@@ -39,23 +72,21 @@ def ke_update(landscape):
     landscape : numpy array
         array contendo a qualidade da paisagem
 
+    dtype : dtype, optional
+        tipo do resultado, o mesmo das populações. The default is None (inteiro).
+
     Returns
     -------
     ke : numpy array
         array contendo a qualidade de suporte da sp. exótica de todos os patches
 
     """
-    
-    if landscape == 2:
-        ke = 500
 
-    elif landscape == 1 or landscape == 0:
-        ke = 1000
+    table = KE_TABLE if dtype is None else KE_TABLE.astype(dtype)
 
-    return ke
+    return table[landscape]
 
 
-@np.vectorize
 def lotka_volterra(pop1, pop2, r, alfa_or_beta, k):
     """
 
@@ -88,25 +119,34 @@ def lotka_volterra(pop1, pop2, r, alfa_or_beta, k):
     return updated_pop1
 
 
-@np.vectorize
 def breque(x):
     """ verifica valores próximos de 0 """
-    
-    if x < 0.001:
-        return 0
-    else:
-        return x
+
+    return np.where(x < 0.001, 0.0, x)
+
+
+def uniforms(rng, shape):
+    """
+    sorteios uniformes em [0, 1) com o shape dado
+
+    Com uma sequência de geradores (um lote de réplicas), a linha i do eixo inicial é
+    sorteada com rng[i], como em uma chamada só com essa réplica.
+    """
+
+    if isinstance(rng, np.random.Generator):
+        return rng.random(shape)
+
+    return np.stack([replicate_rng.random(shape[1:]) for replicate_rng in rng])
 
 
-@np.vectorize
 def random_disturbance(rng, landscape, p):
     """
     distúrbio do padrão aleatório
 
     Parameters
     ----------
-    rng : Generator
-        gerador de números pseudo-aleatórios
+    rng : Generator or sequence of Generator
+        gerador de números pseudo-aleatórios, ou um por paisagem de um lote (ver uniforms)
         
     landscape : numpy array
         array contendo a qualidade da paisagem
@@ -121,22 +161,87 @@ def random_disturbance(rng, landscape, p):
 
     """
     
-    if landscape > 0:
-        generated_p = rng.random()
+    # um sorteio por patch, todos de uma vez
+    disturbed = (landscape > 0) & (uniforms(rng, np.shape(landscape)) <= p)
+
+    return np.where(disturbed, 0, landscape)
+
+
+# versão do gerador de paisagens agregadas: incrementar sempre que clustered_disturbance passar
+# a gerar paisagens diferentes para a mesma seed (invalida a biblioteca de landscapes.py)
+GENERATOR_VERSION = 5
+
+# controle adaptativo do gerador de Hiebeler: propostas sem melhora de d antes da parada
+# (em varreduras, múltiplos do número de patches), fração das propostas sorteadas entre os
+# patches de borda e fator de resfriamento da temperatura por proposta
+PATIENCE_SWEEPS = 5
+BOUNDARY_BIAS = 0.9
+COOLING = 0.9999
+
+
+def desired_blocks(p, q00, n_pairs):
+    """ número desejado de pares vizinhos 00, 02 (nos dois sentidos) e 22, todos pares como as contagens """
+
+    block_00 = 2 * int(p * q00 * n_pairs / 2)
+    block_02 = 2 * int(p * (1 - q00) * n_pairs)
+    block_22 = n_pairs - block_00 - block_02
+    
+    return block_00, block_02, block_22
+
+
+def block_neighbors(neighbor_index):
+    """ vizinhos a distância 1 (blocos 2x1) de cada patch, em formato CSR compacto """
+
+    positions = np.flatnonzero(neighbor_index.dist == 1)
+    pair_owners = neighbors.owners(neighbor_index, positions)
+    pair_targets = neighbor_index.targets[positions]
     
-        if generated_p <= p:
-            landscape = 0
+    pair_offsets = np.zeros(neighbor_index.L * neighbor_index.L + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_owners, minlength=pair_offsets.size - 1), out=pair_offsets[1:])
+    
+    return pair_owners, pair_targets, pair_offsets
+
+
+def count_blocks(disturbed, pair_owners, pair_targets):
+    """ conta os blocos 2x1 da paisagem """
+
+    owner_disturbed = disturbed[pair_owners]
+    target_disturbed = disturbed[pair_targets]
+    
+    count_00 = int(np.count_nonzero(owner_disturbed & target_disturbed))
+    count_22 = int(np.count_nonzero(~owner_disturbed & ~target_disturbed))
+    count_02 = pair_targets.size - count_00 - count_22
+    
+    return count_00, count_02, count_22
 
-    return landscape
 
+def d_value(desired_00, desired_02, desired_22, count_00, count_02, count_22):
+    """ calcula o valor de d (com os pares 02 contados nos dois sentidos, sem o peso 2) """
+    
+    d = abs(desired_00 - count_00) + abs(desired_02 - count_02) + abs(desired_22 - count_22)
+    
+    return d
 
-@np.vectorize
-def clustered_disturbance(rng, landscape, p, q00, neighbors_info, iterations=1000000):
+
+def clustered_disturbance(rng, landscape, p, q00, neighbor_index, iterations=1000000, backend=None, stats=None,
+                          patience=None, temperature=0.0, cooling=COOLING, boundary_bias=BOUNDARY_BIAS):
     """
     distúrbio do padrão agregado
     versão em Python do algoritmo de Hiebeler (2000):
         Hiebeler, D. (2000). Populations on Fragmented Landscapes with Spatially Structured Heterogeneities: Landscape Generation and Local Dispersal. Ecology, 81(6), 1629-1641.
 
+    Os blocos 00/02/22 são contados uma única vez e depois atualizados a cada troca
+    proposta olhando apenas os vizinhos do patch sorteado, sem copiar a paisagem.
+
+    O laço termina quando d chega a 0, após patience propostas sem melhorar o menor d
+    já visto, ou após iterations propostas. Uma fração boundary_bias das propostas é
+    sorteada entre os patches de borda (com algum vizinho de outro estado): a troca de um
+    patch no interior de uma região homogênea cria um patch isolado e raramente reduz d.
+    As demais propostas são uniformes em toda a paisagem.
+    Com temperature > 0 a aceitação é a do recozimento simulado: uma troca que aumenta
+    d em delta é aceita com probabilidade exp(-delta / T), e T é multiplicada por
+    cooling a cada proposta.
+
     Parameters
     ----------
     rng : Generator
@@ -151,11 +256,31 @@ def clustered_disturbance(rng, landscape, p, q00, neighbors_info, iterations=100
     q00 : float
         nível de correlação entre os patches disturbados
         
-    neighbors_info : dict
-        dicionário contendo os vizinhos de cada patch
+    neighbor_index : NeighborIndex
+        índice de vizinhança (ver neighbors.load_neighbor_index)
         
     iterations : int
-        número de iterações desejada. padrão é 1000000.
+        número máximo de propostas. padrão é 1000000.
+        
+    backend : str, optional
+        'numba' ou 'numpy'. The default is None (events.BACKEND).
+        
+    stats : dict, optional
+        se fornecido, recebe 'iterations' (propostas feitas), 'accepted' (trocas aceitas) e
+        'd' (distância final aos blocos desejados). The default is None.
+        
+    patience : int, optional
+        propostas sem melhora de d antes da parada; 0 desativa a parada por paciência.
+        The default is None (PATIENCE_SWEEPS vezes o número de patches).
+        
+    temperature : float, optional
+        temperatura inicial do recozimento simulado. The default is 0.0 (só trocas que reduzem d).
+        
+    cooling : float, optional
+        fator de resfriamento por proposta. The default is COOLING.
+        
+    boundary_bias : float, optional
+        fração das propostas sorteadas entre os patches de borda. The default is BOUNDARY_BIAS.
 
     Returns
     -------
@@ -164,84 +289,573 @@ def clustered_disturbance(rng, landscape, p, q00, neighbors_info, iterations=100
 
     """
 
-    def desired_blocks(p, q00):
-        """ calcula o número de blocos desejados """
-
-        block_00 = int((p * q00) * (50 * 50) * 4)
-        block_02 = int((p - block_00) * (50 * 50) * 4)
-        block_22 = int((1 - (block_00 - (2 * block_02))) * (50 * 50) * 4)
-        
-        return block_00, block_02, block_22
+    landscape = random_disturbance(rng, landscape, p)
+    
+    pair_owners, pair_targets, pair_offsets = block_neighbors(neighbor_index)
+    target = desired_blocks(p, q00, pair_targets.size)
     
-    def count_blocks(landscape, neighbors_info):
-        """ conta os blocos 2x1 da paisagem """
+    if patience is None:
+        patience = PATIENCE_SWEEPS * np.size(landscape)
+    
+    return hiebeler_search(rng, landscape, target, pair_owners, pair_targets, pair_offsets, iterations, backend,
+                           stats, patience, temperature, cooling, boundary_bias)
 
-        count_00 = 0
-        count_02 = 0
-        count_22 = 0
-        
-        for i in range(50):
-            for j in range(50):
-                
-                neighborhood = neighbors_info[i * 50 + j]
-                neighborhood = neighborhood[neighborhood['euclid_dist'] == 1]
-                
-                for neighbor in range(np.size(neighborhood)):
-                    i2 = neighborhood[neighbor]['xviz']
-                    j2 = neighborhood[neighbor]['yviz']
-                    
-                    if landscape[i, j] == 0:
-                        if landscape[i2, j2] == 0:
-                            count_00 += 1
-                        else:
-                            count_02 += 1
-                    else:
-                        if landscape[i2, j2] == 0:
-                            count_02 += 1
-                        else:
-                            count_22 += 1
-        
-        return count_00, count_02, count_22
-     
-    def d_value(desired_00, desired_02, desired_22, count_00, count_02, count_22):
-        """ calcula o valor de d """
-        
-        d = abs(desired_00 - count_00) + 2 * abs(desired_02 - count_02) + abs(desired_22 - count_22)
-        
-        return d
+
+def hiebeler_search(rng, landscape, target, pair_owners, pair_targets, pair_offsets, iterations, backend, stats,
+                    patience, temperature, cooling, boundary_bias):
+    """
+    laço de trocas de clustered_disturbance a partir de uma paisagem já disturbada
+
+    target são os blocos desejados (ver desired_blocks) e pair_owners, pair_targets e
+    pair_offsets os pares vizinhos (ver block_neighbors); os demais argumentos são os de
+    clustered_disturbance, sem valores padrão. Retorna a paisagem pós-distúrbio.
+    """
+
+    n_patches = np.size(landscape)
+    disturbed = np.ravel(landscape) == 0
+    count_00, count_02, count_22 = count_blocks(disturbed, pair_owners, pair_targets)
+    d = d_value(*target, count_00, count_02, count_22)
     
-    target = desired_blocks(p, q00)
-    landscape = random_disturbance(rng, landscape, p)
+    # vizinhos de outro estado de cada patch (patches de borda: mixed > 0)
+    mixed = np.bincount(pair_owners, weights=disturbed[pair_owners] != disturbed[pair_targets],
+                        minlength=n_patches).astype(np.int64)
     
-    for _ in range(iterations):
-        count = count_blocks(landscape, neighbors_info)
-        d = d_value(*target, *count)
-        random_i, random_j = rng.integers(50), rng.integers(50)
+    if use_compiled(backend):
+        landscape_flat = np.ravel(landscape).copy()
+        counts, accepted, performed = compiled.hiebeler(
+            compiled.seed_from(rng), disturbed.astype(np.uint8), landscape_flat, pair_offsets,
+            pair_targets.astype(np.int64), mixed, np.array(target, dtype=np.int64),
+            np.array([count_00, count_02, count_22], dtype=np.int64), iterations, patience,
+            float(temperature), float(cooling), float(boundary_bias))
+        if stats is not None:
+            stats.update(iterations=int(performed), accepted=int(accepted), d=d_value(*target, *counts.tolist()))
+        return landscape_flat.reshape(np.shape(landscape))
     
-        temp_landscape = np.copy(landscape)
-        if temp_landscape[random_i, random_j] == 0:
-            temp_landscape[random_i, random_j] = 1
-        else:
-            temp_landscape[random_i, random_j] = 0
-        
-        temp_count = count_blocks(temp_landscape, neighbors_info)
-        temp_d = d_value(*target, *temp_count)
+    # estruturas compactas do Python para o laço: 1 byte por patch e arrays planos de inteiros
+    landscape_flat = landscape.reshape(-1)
+    disturbed = bytearray(disturbed.tobytes())
+    pair_targets = array.array('q', pair_targets.astype(np.int64).tobytes())
+    pair_offsets = array.array('q', pair_offsets.tobytes())
+    
+    # conjunto dos patches de borda com remoção em O(1): members[where[patch]] == patch
+    mixed = mixed.tolist()
+    members = [patch for patch in range(n_patches) if mixed[patch]]
+    where = [-1] * n_patches
+    for position, patch in enumerate(members):
+        where[patch] = position
+    
+    # três sorteios uniformes por proposta, em lotes: borda ou uniforme, patch e aceitação
+    accepted = 0
+    performed = 0
+    since_best = 0
+    best_d = d
+    chunk = 65536
+    while performed < iterations and d > 0 and (patience <= 0 or since_best < patience):
+        draws = rng.random((min(chunk, iterations - performed), 3)).tolist()
         
-        if temp_d < d:
-            landscape[random_i, random_j] = temp_landscape[random_i, random_j]
+        for u_bias, u_patch, u_accept in draws:
+            performed += 1
+            if members and u_bias < boundary_bias:
+                patch = members[int(u_patch * len(members))]
+            else:
+                patch = int(u_patch * n_patches)
+            
+            neighborhood = pair_targets[pair_offsets[patch]:pair_offsets[patch + 1]]
+            zeros = sum([disturbed[neighbor] for neighbor in neighborhood])
+            others = len(neighborhood) - zeros
+            
+            # cada par vizinho é contado nos dois sentidos
+            if disturbed[patch]:
+                temp_00 = count_00 - 2 * zeros
+                temp_02 = count_02 + 2 * zeros - 2 * others
+                temp_22 = count_22 + 2 * others
+            else:
+                temp_00 = count_00 + 2 * zeros
+                temp_02 = count_02 - 2 * zeros + 2 * others
+                temp_22 = count_22 - 2 * others
+            
+            temp_d = d_value(*target, temp_00, temp_02, temp_22)
+            
+            if temperature > 0:
+                accept = temp_d < d or u_accept < np.exp((d - temp_d) / temperature)
+                temperature *= cooling
+            else:
+                accept = temp_d < d
+            
+            if accept:
+                disturbed[patch] ^= 1
+                count_00, count_02, count_22, d = temp_00, temp_02, temp_22, temp_d
+                accepted += 1
+                landscape_flat[patch] = 1 if landscape_flat[patch] == 0 else 0
+                
+                # bordas: o patch troca de lado em relação a todos os vizinhos
+                mixed[patch] = len(neighborhood) - mixed[patch]
+                for neighbor in neighborhood:
+                    mixed[neighbor] += 1 if disturbed[neighbor] != disturbed[patch] else -1
+                for cell in (patch, *neighborhood):
+                    if mixed[cell] and where[cell] < 0:
+                        where[cell] = len(members)
+                        members.append(cell)
+                    elif not mixed[cell] and where[cell] >= 0:
+                        last = members.pop()
+                        if last != cell:
+                            members[where[cell]] = last
+                            where[last] = where[cell]
+                        where[cell] = -1
+            
+            if d < best_d:
+                best_d = d
+                since_best = 0
+            else:
+                since_best += 1
+            
+            if d == 0 or (patience > 0 and since_best >= patience):
+                break
+    
+    if stats is not None:
+        stats.update(iterations=performed, accepted=accepted, d=d)
         
     return landscape
 
 
-@np.vectorize
-def restoration(rng, landscape, pr):
+# número padrão de blocos (faixas de linhas) do gerador por subredes; os resultados dependem
+# do número de blocos, mas não do número de threads
+CHECKERBOARD_BLOCKS = 64
+
+
+def sublattices(L, pair_owners, pair_targets, pair_offsets):
     """
-    evento de restauração da paisagem
+    coloração dos patches em que vizinhos a distância 1 nunca têm a mesma cor
+
+    O tabuleiro de xadrez (i + j) % 2 serve para bordas fixas e para bordas periódicas
+    com L par; com bordas periódicas e L ímpar, os patches em conflito na emenda
+    recebem, em sequência, a menor cor livre entre seus vizinhos.
+    """
+
+    i, j = np.divmod(np.arange(L * L), L)
+    colors = (i + j) % 2
+
+    conflicts = np.unique(pair_owners[colors[pair_owners] == colors[pair_targets]])
+    if conflicts.size:
+        colors[conflicts] = -1
+        for patch in conflicts:
+            used = set(colors[pair_targets[pair_offsets[patch]:pair_offsets[patch + 1]]].tolist())
+            colors[patch] = min(color for color in range(len(used) + 1) if color not in used)
+
+    return colors
+
+
+def split_residual(rng, residual, weights):
+    """
+    divide, em partes pares com o sinal do total, o que falta para cada contagem de blocos
+
+    As partes são proporcionais a weights (maiores restos, com desempate sorteado). Como
+    todas as partes têm o sinal do total, a soma das distâncias de cada bloco à sua parte
+    é igual a d: se nenhum bloco se afasta da sua parte, d não aumenta.
+    """
+
+    shares = np.zeros((weights.size, 3), dtype=np.int64)
+    for component, total in enumerate(residual):
+        units = abs(int(total)) // 2
+        quotas = units * weights / weights.sum()
+        parts = np.floor(quotas).astype(np.int64)
+        remainders = quotas - parts
+        order = np.lexsort((rng.random(weights.size), -remainders))
+        parts[order[:units - parts.sum()]] += 1
+        shares[:, component] = 2 * np.sign(total) * parts
+
+    return shares
+
+
+def checkerboard_block(rng, disturbed, landscape, pair_offsets, pair_targets, cells, share, proposals, temperature,
+                       boundary_bias):
+    """
+    trocas de compiled.checkerboard_block em NumPy, sorteando do Generator rng do bloco
+
+    Os vizinhos dos patches de cells são de outra subrede e não mudam durante a fase: o
+    número de vizinhos disturbados de cada patch é contado uma vez, e o laço só troca o
+    estado dos patches do bloco. disturbed e landscape são atualizados no lugar no fim;
+    retorna o mesmo que o kernel compilado.
+    """
+
+    # posições em pair_targets dos vizinhos de cada patch do bloco
+    degree = pair_offsets[cells + 1] - pair_offsets[cells]
+    local_owners = np.repeat(np.arange(cells.size), degree)
+    positions = np.arange(degree.sum()) + np.repeat(pair_offsets[cells] - (np.cumsum(degree) - degree), degree)
+    neighbor_disturbed = disturbed[pair_targets[positions]]
+
+    state = disturbed[cells]
+    zeros = np.bincount(local_owners, weights=neighbor_disturbed, minlength=cells.size).astype(np.int64)
+    mixed = np.bincount(local_owners, weights=neighbor_disturbed != state[local_owners], minlength=cells.size)
+
+    # patches de borda do bloco (com algum vizinho de outro estado), fixos durante a fase
+    boundary = np.flatnonzero(mixed).tolist()
+    state = state.tolist()
+    zeros = zeros.tolist()
+    degree = degree.tolist()
+    flipped = bytearray(cells.size)
+
+    share_00, share_02, share_22 = (int(value) for value in share)
+    delta_00, delta_02, delta_22 = 0, 0, 0
+    d = abs(share_00) + abs(share_02) + abs(share_22)
+    accepted = 0
+    performed = 0
+
+    # três sorteios uniformes por proposta, em lotes: borda ou uniforme, patch e aceitação
+    chunk = 65536
+    while performed < proposals and d > 0:
+        draws = rng.random((min(chunk, proposals - performed), 3)).tolist()
+
+        for u_bias, u_patch, u_accept in draws:
+            performed += 1
+            if boundary and u_bias < boundary_bias:
+                local = boundary[int(u_patch * len(boundary))]
+            else:
+                local = int(u_patch * cells.size)
+
+            local_zeros = zeros[local]
+            others = degree[local] - local_zeros
+
+            if state[local]:
+                temp_00 = delta_00 - 2 * local_zeros
+                temp_02 = delta_02 + 2 * local_zeros - 2 * others
+                temp_22 = delta_22 + 2 * others
+            else:
+                temp_00 = delta_00 + 2 * local_zeros
+                temp_02 = delta_02 - 2 * local_zeros + 2 * others
+                temp_22 = delta_22 - 2 * others
+
+            temp_d = abs(share_00 - temp_00) + abs(share_02 - temp_02) + abs(share_22 - temp_22)
+
+            if temperature > 0:
+                accept = temp_d < d or u_accept < np.exp((d - temp_d) / temperature)
+            else:
+                accept = temp_d < d
+
+            if accept:
+                state[local] ^= 1
+                flipped[local] ^= 1
+                delta_00, delta_02, delta_22, d = temp_00, temp_02, temp_22, temp_d
+                accepted += 1
+
+            if d == 0:
+                break
+
+    changed = cells[np.frombuffer(flipped, dtype=np.uint8).astype(bool)]
+    disturbed[changed] ^= 1
+    landscape[changed] = np.where(landscape[changed] == 0, 1, 0)
+
+    return np.array([delta_00, delta_02, delta_22]), accepted, performed
+
+
+def checkerboard_disturbance(rng, landscape, p, q00, neighbor_index, iterations=1000000, backend=None, stats=None,
+                             patience=None, temperature=0.0, cooling=COOLING, boundary_bias=BOUNDARY_BIAS,
+                             workers=None, blocks=CHECKERBOARD_BLOCKS):
+    """
+    distúrbio do padrão agregado com o gerador de Hiebeler paralelizado por subredes
+
+    Os patches são divididos em subredes (ver sublattices) em que nenhum par de patches é
+    vizinho: trocas em patches de uma mesma subrede mudam conjuntos disjuntos de pares, e
+    as variações das contagens 00/02/22 se somam. Cada fase percorre uma subrede: a
+    paisagem é dividida em blocos (faixas de linhas) processados em paralelo, em threads
+    com o kernel compilado sem o GIL (compiled.checkerboard_block), cada um com seu
+    próprio fluxo de números aleatórios (SeedSequence.spawn) e uma parte do que falta
+    para os blocos desejados (ver split_residual). Com temperature = 0, d nunca aumenta
+    de uma fase para a outra. Quando uma volta por todas as subredes não reduz d, o que
+    falta é pequeno demais para ser dividido entre os blocos e a busca termina com o laço
+    serial (hiebeler_search), com as propostas e a paciência restantes. Os blocos
+    desejados são os mesmos de clustered_disturbance.
+
+    Os resultados dependem de blocks, mas não de workers. Sem o Numba, os blocos rodam
+    em sequência com checkerboard_block, cada um sorteando do seu Generator.
+
+    Parameters
+    ----------
+    rng, landscape, p, q00, neighbor_index, iterations, backend, stats, patience, boundary_bias
+        ver clustered_disturbance; iterations conta as propostas de todos os blocos
+
+    temperature : float, optional
+        temperatura inicial do recozimento simulado, constante durante uma fase e
+        multiplicada por cooling a cada proposta feita. The default is 0.0.
+
+    cooling : float, optional
+        fator de resfriamento por proposta. The default is COOLING.
+
+    workers : int, optional
+        número de threads. The default is None (número de CPUs).
+
+    blocks : int, optional
+        número de faixas de linhas da paisagem, limitado a L. The default is CHECKERBOARD_BLOCKS.
+
+    Returns
+    -------
+    landscape : numpy array
+        paisagem pós-distúrbio
+
+    """
+
+    landscape = random_disturbance(rng, landscape, p)
+
+    n_patches = np.size(landscape)
+    pair_owners, pair_targets, pair_offsets = block_neighbors(neighbor_index)
+    target = desired_blocks(p, q00, pair_targets.size)
+    disturbed = (np.ravel(landscape) == 0).astype(np.uint8)
+    counts = np.array(count_blocks(disturbed.astype(bool), pair_owners, pair_targets), dtype=np.int64)
+    d = d_value(*target, *counts.tolist())
+
+    if patience is None:
+        patience = PATIENCE_SWEEPS * n_patches
+
+    # células de cada subrede em cada bloco; os blocos são faixas de linhas consecutivas
+    L = neighbor_index.L
+    colors = sublattices(L, pair_owners, pair_targets, pair_offsets)
+    bounds = np.linspace(0, L, min(blocks, L) + 1).astype(np.int64) * L
+    phases = []
+    for color in range(colors.max() + 1):
+        phase_blocks = {}
+        for block, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            patches = np.flatnonzero(colors[start:stop] == color) + start
+            if patches.size:
+                phase_blocks[block] = patches.astype(np.int64)
+        phases.append(phase_blocks)
+
+    block_rngs = [np.random.default_rng(child) for child in
+                  np.random.SeedSequence(compiled.seed_from(rng)).spawn(len(bounds) - 1)]
+    landscape_flat = np.ravel(landscape).copy()
+    pair_targets = pair_targets.astype(np.int64)
+
+    accepted = 0
+    performed = 0
+    since_best = 0
+    best_d = d
+    phase = 0
+    stalled = 0
+    with ThreadPoolExecutor(max_workers=workers if use_compiled(backend) else 1) as pool:
+        while (performed < iterations and d >= 4 * len(block_rngs) and (patience <= 0 or since_best < patience)
+               and stalled < len(phases)):
+            phase_blocks = phases[phase % len(phases)]
+            cells = list(phase_blocks.values())
+            phase += 1
+
+            weights = np.array([block.size for block in cells], dtype=float)
+            shares = split_residual(rng, np.array(target) - counts, weights)
+            remaining = (iterations - performed) / weights.sum()
+            proposals = [min(block.size, int(np.ceil(block.size * remaining))) for block in cells]
+            if use_compiled(backend):
+                kernel = compiled.checkerboard_block
+                streams = [compiled.seed_from(block_rngs[block]) for block in phase_blocks]
+            else:
+                kernel = checkerboard_block
+                streams = [block_rngs[block] for block in phase_blocks]
+
+            results = list(pool.map(kernel, streams, [disturbed] * len(cells), [landscape_flat] * len(cells),
+                                    [pair_offsets] * len(cells), [pair_targets] * len(cells), cells, shares,
+                                    proposals, [float(temperature)] * len(cells),
+                                    [float(boundary_bias)] * len(cells)))
+
+            phase_performed = sum(result[2] for result in results)
+            counts = counts + sum(result[0] for result in results)
+            accepted += sum(result[1] for result in results)
+            performed += phase_performed
+            temperature *= cooling ** phase_performed
+            d = d_value(*target, *counts.tolist())
+
+            if d < best_d:
+                best_d = d
+                since_best = 0
+                stalled = 0
+            else:
+                since_best += phase_performed
+                stalled += 1
+
+    landscape = landscape_flat.reshape(np.shape(landscape))
+
+    # ajuste final serial: perto do alvo, o que falta não se divide entre os blocos
+    if performed < iterations and d > 0 and (patience <= 0 or since_best < patience):
+        search_stats = {}
+        landscape = hiebeler_search(rng, landscape, target, pair_owners, pair_targets, pair_offsets,
+                                    iterations - performed, backend, search_stats,
+                                    patience - since_best if patience > 0 else 0, temperature, cooling, boundary_bias)
+        performed += search_stats['iterations']
+        accepted += search_stats['accepted']
+        d = search_stats['d']
+
+    if stats is not None:
+        stats.update(iterations=int(performed), accepted=int(accepted), d=d)
+
+    return landscape
+
+
+# comprimento de correlação a partir do qual a correlação entre vizinhos na rede é a do contínuo
+LATTICE_LENGTH = 2.0
+
+
+def pair_probability(threshold, rho):
+    """
+    P(X <= threshold, Y <= threshold) para X e Y normais padrão com correlação rho
+
+    Pela identidade de Plackett, com rho = sin(theta) para remover a singularidade em 1:
+    Phi2 = Phi(t)^2 + 1 / (2 pi) * integral de 0 a arcsin(rho) de exp(-t^2 / (1 + sin(theta))).
+    """
+
+    theta = np.linspace(0.0, np.arcsin(rho), 257)
+    integrand = np.exp(-threshold ** 2 / (1 + np.sin(theta)))
+    integral = np.sum((integrand[1:] + integrand[:-1]) / 2 * np.diff(theta))
+
+    return NORMAL.cdf(threshold) ** 2 + integral / (2 * np.pi)
+
+
+def gaussian_filter(shape, correlation_length):
+    """ filtro gaussiano de desvio padrão correlation_length (em patches) no domínio de rfft2 """
+
+    frequency_2 = np.fft.fftfreq(shape[0])[:, None] ** 2 + np.fft.rfftfreq(shape[1])[None, :] ** 2
+
+    return np.exp(-2 * np.pi ** 2 * correlation_length ** 2 * frequency_2)
+
+
+def neighbor_correlation(correlation_length):
+    """ correlação entre patches vizinhos do ruído branco filtrado, calculada na própria rede """
+
+    if correlation_length == 0:
+        return 0.0
+    if correlation_length >= LATTICE_LENGTH:
+        # contínuo: covariância gaussiana de desvio padrão sqrt(2) * correlation_length
+        return float(np.exp(-1 / (4 * correlation_length ** 2)))
+
+    # grade periódica grande o bastante para que a autocorrelação não se sobreponha
+    size = 64
+    covariance = np.fft.irfft2(gaussian_filter((size, size), correlation_length) ** 2, s=(size, size))
+
+    return float(covariance[1, 0] / covariance[0, 0])
+
+
+def calibrate_field(p, q00, tolerance=1e-6):
+    """
+    comprimento de correlação do campo gaussiano que, limiarizado no quantil p, dá q00
+
+    Parameters
+    ----------
+    p : float
+        fração de patches disturbados
+
+    q00 : float
+        probabilidade de um vizinho de um patch disturbado também ser disturbado
+
+    tolerance : float, optional
+        precisão das bisseções. The default is 1e-6.
+
+    Returns
+    -------
+    correlation_length : float
+        desvio padrão do filtro gaussiano, em patches; 0 (ruído branco) quando q00 <= p,
+        pois um campo gaussiano suavizado não produz correlação negativa, e inf quando
+        q00 >= 1
+
+    """
+
+    if not 0 < p < 1:
+        raise ValueError("o campo gaussiano requer 0 < p < 1")
+    if q00 <= p:
+        return 0.0
+    if q00 >= 1:
+        return float('inf')
+
+    # correlação rho entre vizinhos tal que P(vizinho disturbado | disturbado) = q00
+    threshold = NORMAL.inv_cdf(p)
+    low, high = 0.0, 1.0
+    while high - low > tolerance:
+        rho = (low + high) / 2
+        low, high = (rho, high) if pair_probability(threshold, rho) < p * q00 else (low, rho)
+    rho = (low + high) / 2
+
+    # comprimento de correlação com essa correlação entre vizinhos (crescente no comprimento)
+    length = np.sqrt(-1 / (4 * np.log(rho)))
+    if length >= LATTICE_LENGTH:
+        return float(length)
+
+    low, high = 0.0, LATTICE_LENGTH
+    while high - low > tolerance:
+        length = (low + high) / 2
+        low, high = (length, high) if neighbor_correlation(length) < rho else (low, length)
+
+    return (low + high) / 2
+
+
+def gaussian_disturbance(rng, landscape, p, q00, stats=None):
+    """
+    distúrbio agregado por limiarização de um campo gaussiano sintetizado por FFT
+
+    Ruído branco é filtrado no domínio da frequência por um filtro gaussiano cujo
+    comprimento de correlação é calibrado (calibrate_field) para que, disturbando os
+    round(p * N) patches de menor valor do campo, a fração de vizinhos (a distância 1)
+    disturbados de um patch disturbado seja q00 em média. O custo é O(N log N) no número
+    de patches, sem iterações. O campo é gerado com uma margem de 4 comprimentos de
+    correlação, descartada, para que a periodicidade da FFT não ligue bordas opostas; o
+    comprimento e a margem são limitados ao lado da paisagem, de modo que o campo tem no
+    máximo 3 x 3 vezes a área da paisagem. Com q00 >= 1 não há FFT: os patches disturbados
+    formam uma única mancha, os round(p * N) mais próximos de um centro sorteado.
 
     Parameters
     ----------
     rng : Generator
         gerador de números pseudo-aleatórios
+
+    landscape : numpy array
+        array contendo a qualidade da paisagem
+
+    p : float
+        intensidade do distúrbio
+
+    q00 : float
+        nível de correlação entre os patches disturbados
+
+    stats : dict, optional
+        se fornecido, recebe 'correlation_length'. The default is None.
+
+    Returns
+    -------
+    landscape : numpy array
+        paisagem pós-distúrbio
+
+    """
+
+    shape = np.shape(landscape)
+    correlation_length = min(calibrate_field(p, q00), max(shape))
+
+    if q00 >= 1:
+        # distância ao centro da mancha no lugar do campo
+        centre = rng.random(2) * shape
+        rows, columns = np.indices(shape)
+        field = (rows - centre[0]) ** 2 + (columns - centre[1]) ** 2
+    else:
+        margin = min(int(np.ceil(4 * correlation_length)), max(shape))
+        padded = (shape[0] + 2 * margin, shape[1] + 2 * margin)
+
+        field = rng.standard_normal(padded)
+        if correlation_length > 0:
+            field = np.fft.irfft2(np.fft.rfft2(field) * gaussian_filter(padded, correlation_length), s=padded)
+        field = field[margin:margin + shape[0], margin:margin + shape[1]]
+
+    # os round(p * N) menores valores do campo
+    disturbed = np.zeros(field.size, dtype=bool)
+    n_disturbed = int(round(p * field.size))
+    if n_disturbed > 0:
+        disturbed[np.argpartition(field.ravel(), n_disturbed - 1)[:n_disturbed]] = True
+
+    if stats is not None:
+        stats.update(correlation_length=correlation_length)
+
+    return np.where(disturbed.reshape(shape), 0, landscape)
+
+
+def restoration(rng, landscape, pr):
+    """
+    evento de restauração da paisagem
+
+    Parameters
+    ----------
+    rng : Generator or sequence of Generator
+        gerador de números pseudo-aleatórios, ou um por paisagem de um lote (ver uniforms)
         
     landscape : numpy array
         array contendo a qualidade da paisagem
@@ -255,18 +869,21 @@ def restoration(rng, landscape, pr):
         paisagem após a restauração dos patches
 
     """
-    if landscape < 2:
-        generated_pr = rng.random()
-        
-        if generated_pr <= pr:
-            landscape += 1
+    
+    # um sorteio por patch, todos de uma vez
+    restored = (landscape < 2) & (uniforms(rng, np.shape(landscape)) <= pr)
             
-    return landscape
+    return landscape + restored
         
 
 def invasion(rng, landscape, exopop, exotic_individuals_to_introduce):
     """
     invasão biológica da espécie exótica
+    
+    Os indivíduos são distribuídos uniformemente entre os patches disturbados: um
+    sorteio por indivíduo quando são poucos, ou uma multinomial quando passam de
+    QUANTUM_DRAW_FACTOR por patch disturbado. Os dois sorteios já são vetorizados: o
+    custo não depende do backend nem, acima desse limite, do número de indivíduos.
 
     Parameters
     ----------
@@ -289,18 +906,21 @@ def invasion(rng, landscape, exopop, exotic_individuals_to_introduce):
         
     """
     
-    disturbed_patches = []
-    it = np.nditer(landscape, flags=['multi_index'])
-    for x in it:
-        if x == 0:
-            disturbed_patches.append(it.multi_index)
+    disturbed_patches = np.flatnonzero(np.ravel(landscape) == 0)
 
-    if len(disturbed_patches) >= 1:
-        while exotic_individuals_to_introduce > 0:
-
-            next_x, next_y = disturbed_patches[rng.integers(len(disturbed_patches))]
-            exopop[next_x, next_y] += 1
-            exotic_individuals_to_introduce -= 1
+    if len(disturbed_patches) >= 1 and exotic_individuals_to_introduce > 0:
+        individuals = int(np.ceil(exotic_individuals_to_introduce))
+        
+        if individuals <= QUANTUM_DRAW_FACTOR * len(disturbed_patches):
+            # poucos indivíduos: um sorteio por indivíduo
+            chosen = rng.integers(len(disturbed_patches), size=individuals)
+            arrivals = np.bincount(chosen, minlength=len(disturbed_patches))
+        else:
+            # muitos indivíduos: multinomial uniforme sobre os patches disturbados,
+            # com custo independente do número de indivíduos
+            arrivals = rng.multinomial(individuals, np.full(len(disturbed_patches), 1 / len(disturbed_patches)))
+        
+        exopop[np.unravel_index(disturbed_patches, np.shape(exopop))] += arrivals
 
     return exopop
 
@@ -312,26 +932,26 @@ def campo_medio(pop):
     Parameters
     ----------
     pop : numpy array
-        array contendo a população
+        array contendo a população; com um eixo inicial de réplicas, o campo médio é calculado por réplica
 
     Returns
     -------
-    cm: float
+    cm: float or numpy array
         campo médio
         
     pop: numpy array
         array contendo a população
 
     """
-    cm = breque(np.mean(pop))
+    cm = breque(np.mean(pop, axis=(-2, -1)))
+    extinct = cm == 0
 
-    if cm == 0:
-        pop = np.zeros((50, 50), dtype=float)
+    if np.any(extinct):
+        pop = np.where(extinct[..., None, None], 0.0, pop)
 
     return cm, pop
 
 
-@np.vectorize
 def calc_migrantes(pop, migration_rate):
     """
     calcula os migrantes
@@ -354,14 +974,89 @@ def calc_migrantes(pop, migration_rate):
     return pop * migration_rate
 
 
-def migracao(rng, migrantes, pop, neighbors_info):
+# modos da migração (ver migracao)
+MIGRATION_MODES = ('multinomial', 'individual', 'mean_field')
+
+# limite de grupos de migrantes por par patch-vizinho (ou de indivíduos introduzidos por patch
+# disturbado, na invasão) para o sorteio um a um
+QUANTUM_DRAW_FACTOR = 4
+
+
+def migrant_quanta(migrantes):
+    """ número de grupos de 10 indivíduos enviados por patch (enquanto restar >= 1 migrante) """
+
+    quanta = np.floor((migrantes - 1) / 10) + 1
+
+    return np.where(migrantes >= 1, quanta, 0).astype(np.int64)
+
+
+def mean_field_arrivals(migrantes, neighbor_index, dtype=float):
+    """
+    chegadas esperadas quando cada patch divide os seus migrantes igualmente entre os vizinhos
+
+    A chegada em cada patch é a soma de migrantes / grau sobre a vizinhança, calculada como
+    uma convolução com o estêncil de raio R (uma soma de fatias deslocadas por vizinho do
+    estêncil, com np.roll nas bordas periódicas), sem sorteios. Um lote de paisagens
+    (eixos iniciais) é convolvido de uma vez.
+
+    Parameters
+    ----------
+    migrantes : numpy array
+        migrantes de cada patch, shape (..., L, L) ou (..., L * L)
+
+    neighbor_index : NeighborIndex
+        índice de vizinhança (ver neighbors.load_neighbor_index)
+
+    dtype : dtype, optional
+        tipo das chegadas. The default is float.
+
+    Returns
+    -------
+    arrivals : numpy array of shape (..., L, L)
+        chegadas em cada patch
+
+    """
+
+    L = neighbor_index.L
+    degree = np.diff(neighbor_index.offsets).reshape(L, L)
+    lead = np.shape(migrantes)[:-2] if np.shape(migrantes)[-2:] == (L, L) else np.shape(migrantes)[:-1]
+    share = (np.reshape(migrantes, (*lead, L, L)) / degree).astype(dtype, copy=False)
+    arrivals = np.zeros(np.shape(share), dtype=dtype)
+
+    for x, y in zip(*neighbors.stencil(neighbor_index.R)):
+        if neighbor_index.boundary == 'periodic':
+            arrivals += np.roll(share, (x, y), axis=(-2, -1))
+        else:
+            arrivals[..., max(x, 0):L + min(x, 0), max(y, 0):L + min(y, 0)] += \
+                share[..., max(-x, 0):L + min(-x, 0), max(-y, 0):L + min(-y, 0)]
+
+    return arrivals
+
+
+def migracao(rng, migrantes, pop, neighbor_index, mode='individual', backend=None, patches=None):
     """
     migração das espécies entre os patches
+    
+    Os migrantes saem em grupos de 10 indivíduos, cada grupo para um vizinho sorteado.
+    No modo 'multinomial' a divisão dos grupos de cada patch entre os seus vizinhos é
+    sorteada de uma vez (multinomial uniforme), para todos os patches simultaneamente,
+    e o custo é limitado por patches x vizinhos: quando o total de grupos é pequeno
+    (até QUANTUM_DRAW_FACTOR grupos por par patch-vizinho) os destinos de todos os grupos
+    são sorteados em um único vetor, caso contrário a multinomial é sorteada como
+    binomiais condicionais. O modo 'individual' sorteia um vizinho por grupo, um a um,
+    como na versão original. O modo 'mean_field' é determinístico: os migrantes de cada
+    patch (sem grupos de 10) são divididos igualmente entre os seus vizinhos, a média da
+    migração sorteada a menos do arredondamento dos grupos (ver mean_field_arrivals).
+
+    Com patches, apenas esses patches (os únicos ocupados) enviam migrantes e migrantes
+    contém os valores só desses patches; o custo deixa de depender do tamanho da paisagem
+    (exceto no backend 'numba' e no modo 'mean_field') e os sorteios são os mesmos do
+    caminho denso.
 
     Parameters
     ----------
     rng : Generator
-        gerador de números pseudo-aleatórios
+        gerador de números pseudo-aleatórios (não usado no modo 'mean_field')
         
     migrantes: numpy array
         array contendo os migrantes
@@ -369,8 +1064,18 @@ def migracao(rng, migrantes, pop, neighbors_info):
     pop : numpy array
         array contendo a população
         
-    neighbors_info : dict
-        dicionário contendo os vizinhos de cada patch
+    neighbor_index : NeighborIndex
+        índice de vizinhança (ver neighbors.load_neighbor_index)
+        
+    mode : str, optional
+        'multinomial', 'individual' ou 'mean_field'. The default is 'individual'.
+        
+    backend : str, optional
+        'numba' ou 'numpy', usado no modo 'multinomial'; o modo 'individual' é sempre
+        o de referência em NumPy. The default is None (events.BACKEND).
+        
+    patches : numpy array, optional
+        índices planos, em ordem crescente, dos patches ocupados. The default is None (todos).
 
     Returns
     -------
@@ -379,20 +1084,154 @@ def migracao(rng, migrantes, pop, neighbors_info):
 
     """
 
-    it = np.nditer(migrantes, flags=['multi_index'])
-    for x in it:
-        neighbors = neighbors_info[it.multi_index[0] * 50 + it.multi_index[1]]
-        current_migrantes = np.copy(x)
-           
-        while current_migrantes >= 1:
-            current_neighbor = neighbors[rng.integers(neighbors.shape[0])]
-            pop[current_neighbor['xviz'], current_neighbor['yviz']] += 10
-            current_migrantes -= 10
+    offsets, targets = neighbor_index.offsets, neighbor_index.targets
+    pop_flat = np.ravel(pop)
+    
+    if mode == 'mean_field':
+        # com patches, os demais patches não têm migrantes: a convolução densa dá o mesmo resultado
+        if patches is not None:
+            dense = np.zeros(pop_flat.size, dtype=np.result_type(migrantes))
+            dense[patches] = migrantes
+            migrantes = dense
+        pop_flat += mean_field_arrivals(migrantes, neighbor_index, pop_flat.dtype).reshape(-1)
+        return pop_flat.reshape(np.shape(pop))
+    
+    quanta = migrant_quanta(np.ravel(migrantes))
+    sources = np.flatnonzero(quanta)
+    
+    # grupos de cada patch de origem
+    source_quanta = quanta[sources]
+    if patches is not None:
+        sources = patches[sources]
+    
+    if mode == 'individual':
+        for patch, patch_quanta in zip(sources, source_quanta):
+            start = offsets[patch]
+            chosen = rng.integers(offsets[patch + 1] - start, size=patch_quanta)
+            np.add.at(pop_flat, targets[start + chosen], 10)
+            
+    elif mode == 'multinomial' and use_compiled(backend):
+        if patches is not None:
+            quanta = np.zeros(pop_flat.size, dtype=np.int64)
+            quanta[sources] = source_quanta
+        pop_flat += 10 * compiled.migrate(np.array([compiled.seed_from(rng)]), quanta[np.newaxis], offsets,
+                                          targets, QUANTUM_DRAW_FACTOR)[0]
+        
+    elif mode == 'multinomial':
+        remaining = source_quanta
+        start = offsets[sources]
+        degree = offsets[sources + 1] - start
+        
+        # chegadas em um vetor denso ou, com patches, como pares (destino, grupos)
+        arrivals = np.zeros(pop_flat.size, dtype=pop_flat.dtype) if patches is None else []
+        
+        def deliver(destinations, sent=None):
+            if patches is None:
+                arrivals[:] += np.bincount(destinations, weights=sent, minlength=pop_flat.size)
+            else:
+                arrivals.append((destinations, np.ones(destinations.size) if sent is None else sent))
+        
+        # com poucos grupos por vizinho é mais barato sortear o destino de cada grupo
+        # (mesma distribuição); o custo continua limitado por patches x vizinhos
+        if remaining.sum() <= QUANTUM_DRAW_FACTOR * degree.sum():
+            quantum_start = np.repeat(start, remaining)
+            quantum_degree = np.repeat(degree, remaining)
+            chosen = (rng.random(quantum_degree.size) * quantum_degree).astype(np.int64)
+            deliver(targets[quantum_start + chosen])
+            sources = sources[:0]
+        
+        # multinomial uniforme como sequência de binomiais condicionais, vizinho a vizinho
+        slot = 0
+        while sources.size > 0:
+            sent = rng.binomial(remaining, 1 / (degree - slot))
+            deliver(targets[start + slot], sent)
+            remaining -= sent
+            slot += 1
+            
+            keep = (remaining > 0) & (degree > slot)
+            sources, remaining, start, degree = sources[keep], remaining[keep], start[keep], degree[keep]
+        
+        if patches is None:
+            pop_flat += 10 * arrivals
+        elif arrivals:
+            # soma das chegadas por destino, sem arrays do tamanho da paisagem
+            destinations, sent = (np.concatenate(parts) for parts in zip(*arrivals))
+            reached, inverse = np.unique(destinations, return_inverse=True)
+            pop_flat[reached] += 10 * np.bincount(inverse, weights=sent)
+        
+    else:
+        raise ValueError(f"modo de migração desconhecido: {mode}")
+
+    return pop_flat.reshape(np.shape(pop))
+
+
+def migracao_ensemble(rngs, migrantes, pop, neighbor_index, mode='individual', backend=None, patches=None):
+    """
+    migração de um lote de réplicas, cada uma com o seu gerador
+
+    pop tem shape (n_replicates, L, L). No modo 'mean_field' e no modo 'multinomial' com o
+    backend 'numba', o lote inteiro é processado de uma vez: uma única convolução (ver
+    mean_field_arrivals) ou uma única chamada do kernel, com uma seed sorteada do gerador
+    de cada réplica. Nos demais modos os sorteios são feitos em NumPy réplica a réplica,
+    com migracao. Em todos os casos a réplica i recebe exatamente a migração de
+    migracao(rngs[i], ...).
+
+    Parameters
+    ----------
+    rngs : sequence of Generator
+        gerador de cada réplica
+
+    migrantes : numpy array
+        migrantes de cada patch, shape (n_replicates, L, L), ou só dos patches com patches
+
+    pop : numpy array
+        populações das réplicas, atualizadas no lugar
+
+    neighbor_index, mode, backend
+        ver migracao
+
+    patches : numpy array, optional
+        índices planos, em ordem crescente, dos patches ocupados no lote achatado
+        (n_replicates * L * L). The default is None (todos).
+
+    Returns
+    -------
+    pop : numpy array
+        populações atualizadas após a migração
+
+    """
+
+    n_replicates = len(rngs)
+    patches_per_replicate = neighbor_index.L * neighbor_index.L
+
+    if mode == 'mean_field' or (mode == 'multinomial' and use_compiled(backend)):
+        if patches is not None:
+            dense = np.zeros(n_replicates * patches_per_replicate, dtype=np.result_type(migrantes))
+            dense[patches] = migrantes
+            migrantes = dense
+        migrantes = np.reshape(migrantes, (n_replicates, patches_per_replicate))
+
+        if mode == 'mean_field':
+            arrivals = mean_field_arrivals(migrantes, neighbor_index, pop.dtype)
+        else:
+            seeds = np.array([compiled.seed_from(rng) for rng in rngs])
+            arrivals = 10 * compiled.migrate(seeds, migrant_quanta(migrantes), neighbor_index.offsets,
+                                             neighbor_index.targets, QUANTUM_DRAW_FACTOR)
+        pop += arrivals.reshape(np.shape(pop))
+        return pop
+
+    for replicate, rng in enumerate(rngs):
+        if patches is None:
+            pop[replicate] = migracao(rng, migrantes[replicate], pop[replicate], neighbor_index, mode, backend)
+        else:
+            lo, hi = np.searchsorted(patches, [replicate * patches_per_replicate,
+                                               (replicate + 1) * patches_per_replicate])
+            pop[replicate] = migracao(rng, migrantes[lo:hi], pop[replicate], neighbor_index, mode, backend,
+                                      patches=patches[lo:hi] - replicate * patches_per_replicate)
 
     return pop
 
 
-@np.vectorize
 def remove_migrantes(pop, migrantes):
     """
     retira os migrantes de seus patches antigos
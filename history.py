@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+def pack_landscape(landscape):
+    """
+    empacota paisagens de valores 0, 1 e 2 em dois planos de bits por paisagem
+
+    Parameters
+    ----------
+    landscape : numpy array
+        paisagem ou lote de paisagens, shape (..., L, L)
+
+    Returns
+    -------
+    packed : numpy array of uint8
+        shape (..., 2, ceil(L * L / 8)); o primeiro plano é a máscara dos patches
+        disturbados (0) e o segundo a dos patches de qualidade 1
+
+    """
+
+    flat = np.reshape(landscape, (*np.shape(landscape)[:-2], -1))
+
+    return np.stack([np.packbits(flat == 0, axis=-1), np.packbits(flat == 1, axis=-1)], axis=-2)
+
+
+def unpack_landscape(packed, matrix_size, dtype=int):
+    """ inverso de pack_landscape, para paisagens de tamanho matrix_size """
+
+    planes = np.unpackbits(packed, axis=-1, count=matrix_size[0] * matrix_size[1])
+    landscape = 2 - 2 * planes[..., 0, :] - planes[..., 1, :]
+
+    return landscape.astype(dtype).reshape(*np.shape(packed)[:-2], *matrix_size)
+
+
+def landscape_storage(matrix_size, packed_landscape):
+    """ shape de uma paisagem armazenada """
+
+    if packed_landscape:
+        return (2, (matrix_size[0] * matrix_size[1] + 7) // 8)
+
+    return tuple(matrix_size)
+
+
+class HistoryRecorder:
+    """
+    histórico da simulação em buffers pré-alocados
+
+    Os buffers de shape (total_num_generations, *matrix_size) são criados uma única vez
+    e cada geração é escrita no seu lugar, em vez de np.append copiar todo o histórico
+    a cada geração. Com replicates, os buffers ganham um eixo inicial de réplicas:
+    (replicates, total_num_generations, *matrix_size) e (replicates, total_num_generations).
+
+    Parameters
+    ----------
+    total_num_generations : int
+        número total de gerações (incluindo t = 0)
+
+    matrix_size : (int, int)
+        tamanho da paisagem
+
+    population_dtype : dtype, optional
+        tipo das populações armazenadas. The default is float.
+
+    landscape_dtype : dtype, optional
+        tipo da paisagem armazenada. The default is int.
+
+    packed_landscape : bool, optional
+        se a paisagem é armazenada com pack_landscape (2 bits por patch); stored_landscape
+        tem então shape (total_num_generations, 2, ceil(L * L / 8)). The default is False.
+
+    path : str, optional
+        arquivo .npz onde o histórico é salvo em close(). The default is None (não salva).
+
+    replicates : int, optional
+        número de réplicas gravadas juntas (modo ensemble). The default is None (uma simulação).
+
+    """
+
+    def __init__(self, total_num_generations, matrix_size, population_dtype=float, landscape_dtype=int,
+                 path=None, replicates=None, packed_landscape=False):
+        lead = () if replicates is None else (replicates,)
+        self.total_num_generations = total_num_generations
+        self.path = path
+        self.packed_landscape = packed_landscape
+        landscape_shape = landscape_storage(matrix_size, packed_landscape)
+        if packed_landscape:
+            landscape_dtype = np.uint8
+        self.stored_mean_nat = np.zeros((*lead, total_num_generations), dtype=float)
+        self.stored_mean_exo = np.zeros((*lead, total_num_generations), dtype=float)
+        self.stored_natpop = np.zeros((*lead, total_num_generations, *matrix_size), dtype=population_dtype)
+        self.stored_exopop = np.zeros((*lead, total_num_generations, *matrix_size), dtype=population_dtype)
+        self.stored_landscape = np.zeros((*lead, total_num_generations, *landscape_shape), dtype=landscape_dtype)
+        self.stored_generations = np.zeros(total_num_generations, dtype=int)
+        self.size = 0
+        self.termination = None
+        self.segments = []
+
+    def record(self, gen, native_population, exotic_population, landscape, mean_nat, mean_exo):
+        """ grava o estado da geração gen na próxima posição livre """
+
+        row = self.size
+        self.stored_mean_nat[..., row] = mean_nat
+        self.stored_mean_exo[..., row] = mean_exo
+        self.stored_natpop[..., row, :, :] = native_population
+        self.stored_exopop[..., row, :, :] = exotic_population
+        self.stored_landscape[..., row, :, :] = pack_landscape(landscape) if self.packed_landscape else landscape
+        self.stored_generations[row] = gen
+        self.size += 1
+
+    def arrays(self, start=0):
+        """
+        retorna o histórico gravado até agora
+
+        Parameters
+        ----------
+        start : int, optional
+            primeira linha retornada. The default is 0.
+
+        Returns
+        -------
+        (stored_mean_nat, stored_mean_exo, stored_natpop, stored_exopop, stored_landscape, stored_generations)
+            na ordem usada em np.savez pelos cenários
+
+        """
+
+        row = self.size
+        return (self.stored_mean_nat[..., start:row], self.stored_mean_exo[..., start:row],
+                self.stored_natpop[..., start:row, :, :], self.stored_exopop[..., start:row, :, :],
+                self.stored_landscape[..., start:row, :, :], self.stored_generations[start:row])
+
+    def save(self, path):
+        """ salva o histórico em path com np.savez """
+
+        np.savez(path, *self.arrays())
+
+    def checkpoint(self, path):
+        """
+        estado a guardar no checkpoint path: (arrays, contadores)
+
+        Só as linhas gravadas desde o checkpoint anterior são escritas, em um segmento
+        {start}-{stop}.npz do diretório {path}.history; os contadores listam os segmentos
+        do histórico, e o custo de cada checkpoint não cresce com o histórico já gravado.
+        Segmentos nunca são sobrescritos: um checkpoint anterior continua válido.
+        """
+
+        directory = f'{path}.history'
+        os.makedirs(directory, exist_ok=True)
+
+        start = self.segments[-1][1] if self.segments else 0
+        if self.size > start:
+            names = ('mean_nat', 'mean_exo', 'natpop', 'exopop', 'landscape', 'generations')
+            segment = os.path.join(directory, f'{start}-{self.size}.npz')
+            np.savez(f'{segment}.tmp.npz', **dict(zip(names, self.arrays(start))))
+            os.replace(f'{segment}.tmp.npz', segment)
+            self.segments.append((start, self.size))
+
+        return {}, {'size': self.size, 'termination': self.termination, 'segments': self.segments}
+
+    def restore(self, arrays, counters, path):
+        """ restaura o histórico guardado por checkpoint no checkpoint path """
+
+        self.size = counters['size']
+        self.termination = counters['termination']
+        self.segments = [tuple(segment) for segment in counters['segments']]
+
+        for start, stop in self.segments:
+            with np.load(os.path.join(f'{path}.history', f'{start}-{stop}.npz')) as stored:
+                self.stored_mean_nat[..., start:stop] = stored['mean_nat']
+                self.stored_mean_exo[..., start:stop] = stored['mean_exo']
+                self.stored_natpop[..., start:stop, :, :] = stored['natpop']
+                self.stored_exopop[..., start:stop, :, :] = stored['exopop']
+                self.stored_landscape[..., start:stop, :, :] = stored['landscape']
+                self.stored_generations[start:stop] = stored['generations']
+
+    def close(self):
+        """ encerra a gravação, salvando em self.path se houver """
+
+        if self.path is not None:
+            self.save(self.path)
+
+
+class StreamingWriter:
+    """
+    histórico da simulação gravado em disco durante a execução
+
+    Cada série é um arquivo .npy mapeado em memória (numpy.lib.format.open_memmap),
+    preenchido geração a geração, de modo que a memória usada não depende de
+    total_num_generations e uma execução interrompida mantém o que já foi gravado.
+    As grades (populações e paisagem) são gravadas a cada grid_stride gerações e as
+    médias a cada mean_stride gerações; o número de linhas já gravadas (e o término
+    antecipado, se houver) fica em progress.json, criado com zero linhas na construção e
+    atualizado a cada flush.
+
+    Arquivos em directory: natpop.npy, exopop.npy, landscape.npy, grid_generations.npy,
+    mean_nat.npy, mean_exo.npy, mean_generations.npy e progress.json. Com replicates, as
+    séries ganham um eixo inicial de réplicas, como em HistoryRecorder.
+
+    Parameters
+    ----------
+    directory : str
+        diretório de saída
+
+    total_num_generations : int
+        número total de gerações (incluindo t = 0)
+
+    matrix_size : (int, int)
+        tamanho da paisagem
+
+    grid_stride : int, optional
+        intervalo de gerações entre as grades gravadas. The default is 1.
+
+    mean_stride : int, optional
+        intervalo de gerações entre as médias gravadas. The default is 1.
+
+    population_dtype : dtype, optional
+        tipo das populações armazenadas. The default is float.
+
+    landscape_dtype : dtype, optional
+        tipo da paisagem armazenada. The default is int.
+
+    packed_landscape : bool, optional
+        se a paisagem é armazenada com pack_landscape (ver HistoryRecorder e load_stream).
+        The default is False.
+
+    flush_every : int, optional
+        número de gerações entre as sincronizações com o disco. The default is 10.
+
+    replicates : int, optional
+        número de réplicas gravadas juntas (modo ensemble). The default is None (uma simulação).
+
+    resume : bool, optional
+        se os arquivos já existentes em directory são reabertos para continuar a gravação
+        (ver restore). The default is False.
+
+    """
+
+    def __init__(self, directory, total_num_generations, matrix_size, grid_stride=1, mean_stride=1,
+                 population_dtype=float, landscape_dtype=int, flush_every=10, replicates=None, resume=False,
+                 packed_landscape=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.grid_stride = grid_stride
+        self.mean_stride = mean_stride
+        self.flush_every = flush_every
+        self.matrix_size = tuple(matrix_size)
+        self.packed_landscape = packed_landscape
+        landscape_shape = landscape_storage(matrix_size, packed_landscape)
+        if packed_landscape:
+            landscape_dtype = np.uint8
+
+        lead = () if replicates is None else (replicates,)
+        n_grids = len(range(0, total_num_generations, grid_stride))
+        n_means = len(range(0, total_num_generations, mean_stride))
+
+        def series(name, dtype, shape):
+            path = os.path.join(directory, f'{name}.npy')
+            if resume:
+                return open_memmap(path, mode='r+')
+            return open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+        self.natpop = series('natpop', population_dtype, (*lead, n_grids, *matrix_size))
+        self.exopop = series('exopop', population_dtype, (*lead, n_grids, *matrix_size))
+        self.landscape = series('landscape', landscape_dtype, (*lead, n_grids, *landscape_shape))
+        self.grid_generations = series('grid_generations', int, (n_grids,))
+        self.mean_nat = series('mean_nat', float, (*lead, n_means))
+        self.mean_exo = series('mean_exo', float, (*lead, n_means))
+        self.mean_generations = series('mean_generations', int, (n_means,))
+
+        self.grid_size = 0
+        self.mean_size = 0
+        self.records = 0
+        self.termination = None
+
+        # progress.json já existe com zero linhas: uma execução interrompida antes do
+        # primeiro flush continua legível por load_stream
+        if not resume:
+            self.flush()
+
+    def record(self, gen, native_population, exotic_population, landscape, mean_nat, mean_exo):
+        """ grava as médias e/ou as grades da geração gen, conforme os intervalos """
+
+        if gen % self.mean_stride == 0:
+            row = self.mean_size
+            self.mean_nat[..., row] = mean_nat
+            self.mean_exo[..., row] = mean_exo
+            self.mean_generations[row] = gen
+            self.mean_size += 1
+
+        if gen % self.grid_stride == 0:
+            row = self.grid_size
+            self.natpop[..., row, :, :] = native_population
+            self.exopop[..., row, :, :] = exotic_population
+            self.landscape[..., row, :, :] = pack_landscape(landscape) if self.packed_landscape else landscape
+            self.grid_generations[row] = gen
+            self.grid_size += 1
+
+        self.records += 1
+        if self.records % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        """ sincroniza os arquivos com o disco e atualiza progress.json """
+
+        for series in (self.natpop, self.exopop, self.landscape, self.grid_generations,
+                       self.mean_nat, self.mean_exo, self.mean_generations):
+            series.flush()
+
+        path = os.path.join(self.directory, 'progress.json')
+        with open(f'{path}.tmp', 'w') as handle:
+            json.dump({'grids': self.grid_size, 'means': self.mean_size, 'termination': self.termination,
+                       'packed_landscape': self.packed_landscape, 'matrix_size': self.matrix_size}, handle)
+        os.replace(f'{path}.tmp', path)
+
+    def checkpoint(self, path):
+        """
+        sincroniza os arquivos e retorna o estado a guardar no checkpoint path: (arrays, contadores)
+
+        O histórico já está em directory; o checkpoint guarda só os contadores.
+        """
+
+        self.flush()
+
+        return {}, {'grid_size': self.grid_size, 'mean_size': self.mean_size, 'records': self.records,
+                    'termination': self.termination}
+
+    def restore(self, arrays, counters, path):
+        """ retoma a gravação a partir dos contadores guardados por checkpoint """
+
+        self.grid_size = counters['grid_size']
+        self.mean_size = counters['mean_size']
+        self.records = counters['records']
+        self.termination = counters['termination']
+
+    def close(self):
+        """ encerra a gravação """
+
+        self.flush()
+
+
+def load_stream(directory, mmap_mode='r', unpack=True):
+    """
+    lê o histórico gravado por StreamingWriter, apenas as linhas já gravadas
+
+    Parameters
+    ----------
+    directory : str
+        diretório de saída do StreamingWriter
+
+    mmap_mode : str, optional
+        modo de abertura dos arquivos (ver numpy.load). The default is 'r'.
+
+    unpack : bool, optional
+        se a paisagem gravada com packed_landscape é desempacotada (lida inteira para a
+        memória); caso contrário é retornada como gravada. The default is True.
+
+    Returns
+    -------
+    history : dict
+        séries 'natpop', 'exopop', 'landscape', 'grid_generations', 'mean_nat', 'mean_exo'
+        e 'mean_generations', e o término antecipado 'termination' (None se não houve)
+
+    """
+
+    with open(os.path.join(directory, 'progress.json')) as handle:
+        progress = json.load(handle)
+
+    history = {}
+    for name in ('natpop', 'exopop', 'landscape'):
+        history[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)[..., :progress['grids'], :, :]
+    for name in ('mean_nat', 'mean_exo'):
+        history[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)[..., :progress['means']]
+    history['grid_generations'] = np.load(os.path.join(directory, 'grid_generations.npy'),
+                                          mmap_mode=mmap_mode)[:progress['grids']]
+    history['mean_generations'] = np.load(os.path.join(directory, 'mean_generations.npy'),
+                                          mmap_mode=mmap_mode)[:progress['means']]
+    history['termination'] = progress.get('termination')
+
+    if unpack and progress.get('packed_landscape'):
+        history['landscape'] = unpack_landscape(history['landscape'], progress['matrix_size'])
+
+    return history
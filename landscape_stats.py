@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Estatísticas de pares das paisagens agregadas: p e q00 realmente obtidos por cada gerador.
+
+pair_statistics conta os pares de vizinhos a distância 1 (4 vizinhos, bordas fixas) de
+uma paisagem: a fração p de patches disturbados e q00, a probabilidade de um vizinho de
+um patch disturbado também ser disturbado. O programa gera paisagens com o gerador de
+Hiebeler (events.clustered_disturbance), com a sua versão paralela por subredes
+(events.checkerboard_disturbance) e com o campo gaussiano (events.gaussian_disturbance)
+para cada combinação de p e q00 e compara os valores obtidos com os pedidos.
+
+Uso:
+    python landscape_stats.py --p 0.3 0.5 --q00 0.6 0.9 --size 200 --seeds 1 2 3
+    python landscape_stats.py --method gaussian --p 0.5 --q00 0.9 --size 2000
+    python landscape_stats.py --method hiebeler checkerboard --p 0.3 --q00 0.6 --size 500
+
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+from numpy.random import default_rng
+
+import events
+import neighbors
+
+# geradores de paisagens agregadas
+METHODS = ('hiebeler', 'checkerboard', 'gaussian')
+
+R = 3
+
+
+def pair_statistics(landscape):
+    """
+    estatísticas de pares de vizinhos a distância 1 de uma paisagem
+
+    Parameters
+    ----------
+    landscape : numpy array
+        paisagem (L, L); os patches disturbados têm qualidade 0
+
+    Returns
+    -------
+    statistics : dict
+        'p' (fração de patches disturbados), 'q00' (fração de vizinhos disturbados dos
+        patches disturbados) e 'pairs_00', 'pairs_02', 'pairs_22' (pares ordenados, os
+        pares 02 contados nos dois sentidos, como em events.clustered_disturbance)
+
+    """
+
+    disturbed = np.asarray(landscape) == 0
+    pairs = ((disturbed[:, 1:], disturbed[:, :-1]), (disturbed[1:, :], disturbed[:-1, :]))
+
+    pairs_00 = 2 * sum(int(np.count_nonzero(first & second)) for first, second in pairs)
+    pairs_22 = 2 * sum(int(np.count_nonzero(~first & ~second)) for first, second in pairs)
+    pairs_02 = 2 * sum(first.size for first, _ in pairs) - pairs_00 - pairs_22
+
+    # pares que começam em um patch disturbado: 00 e metade dos 02
+    from_disturbed = pairs_00 + pairs_02 // 2
+
+    return {'p': float(np.mean(disturbed)), 'q00': pairs_00 / from_disturbed if from_disturbed else float('nan'),
+            'pairs_00': pairs_00, 'pairs_02': pairs_02, 'pairs_22': pairs_22}
+
+
+def generate(method, seed, p, q00, L, inicial_patch_quality=2, **options):
+    """ paisagem agregada gerada por method ('hiebeler', 'checkerboard' ou 'gaussian') e o tempo gasto """
+
+    landscape = np.full((L, L), inicial_patch_quality, dtype=int)
+    rng = default_rng(seed)
+
+    start = time.perf_counter()
+    if method == 'hiebeler':
+        landscape = events.clustered_disturbance(rng, landscape, p, q00, neighbors.cached_neighbor_index(L, R),
+                                                 **options)
+    elif method == 'checkerboard':
+        landscape = events.checkerboard_disturbance(rng, landscape, p, q00, neighbors.cached_neighbor_index(L, R),
+                                                    **options)
+    elif method == 'gaussian':
+        landscape = events.gaussian_disturbance(rng, landscape, p, q00)
+    else:
+        raise ValueError(f"gerador desconhecido: {method}")
+
+    return landscape, time.perf_counter() - start
+
+
+def validate(method, p, q00, L, seeds, **options):
+    """
+    estatísticas obtidas por um gerador em várias seeds
+
+    Returns
+    -------
+    result : dict
+        médias e desvios padrão entre seeds de 'p' e 'q00' ('p_std', 'q00_std') e o tempo
+        médio de geração 'seconds'
+
+    """
+
+    rows = []
+    for seed in seeds:
+        landscape, seconds = generate(method, seed, p, q00, L, **options)
+        rows.append({**pair_statistics(landscape), 'seconds': seconds})
+
+    result = {}
+    for name in ('p', 'q00'):
+        values = [row[name] for row in rows]
+        result[name], result[f'{name}_std'] = float(np.mean(values)), float(np.std(values))
+    result['seconds'] = float(np.mean([row['seconds'] for row in rows]))
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--method', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--p', type=float, nargs='+', default=[0.3, 0.5])
+    parser.add_argument('--q00', type=float, nargs='+', default=[0.6, 0.9])
+    parser.add_argument('--size', type=int, default=100, help='lado L da paisagem')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    args = parser.parse_args()
+
+    print(f"{'gerador':<14}{'p':>6}{'q00':>6}{'p obtido':>18}{'q00 obtido':>18}{'tempo (s)':>11}")
+    for method, p, q00 in itertools.product(args.method, args.p, args.q00):
+        result = validate(method, p, q00, args.size, args.seeds)
+        print(f"{method:<14}{p:>6.2f}{q00:>6.2f}{result['p']:>11.4f} ± {result['p_std']:.4f}"
+              f"{result['q00']:>11.4f} ± {result['q00_std']:.4f}{result['seconds']:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Biblioteca em disco de paisagens agregadas (distúrbio inicial agregado).
+
+Cada paisagem gerada por events.clustered_disturbance (Hiebeler),
+events.checkerboard_disturbance (Hiebeler em paralelo) ou events.gaussian_disturbance
+(campo gaussiano) é guardada em
+directory/<hash>.npz, identificada por (p, q00, L, R, borda, seed, qualidade inicial,
+iterações, backend, gerador e seu controle adaptativo, versão do gerador). A paisagem
+(valores 0, 1 e 2) é guardada com history.pack_landscape, 2 bits por patch. O índice
+(index.json) registra o tamanho e o último uso de cada paisagem; quando o total
+passa de max_bytes, as paisagens usadas há mais tempo são removidas.
+
+Para que o resultado de uma simulação não dependa de a paisagem já estar na
+biblioteca, a paisagem é gerada com um gerador próprio, derivado da seed
+(landscape_rng), e não com o gerador da simulação.
+
+Uso (pré-construção da biblioteca antes de uma varredura):
+    python landscapes.py --p 0.3 0.5 --q00 0.8 0.9 --size 50 --seeds 1 2 3 --processes 8
+
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava do índice (ver LandscapeLibrary.locked)
+    fcntl = None
+
+import numpy as np
+from numpy.random import default_rng
+
+import events
+import neighbors
+from history import pack_landscape, unpack_landscape
+
+# diretório padrão da biblioteca
+LIBRARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'landscape_library')
+
+# tamanho máximo padrão da biblioteca, em bytes
+MAX_BYTES = 2 ** 30
+
+# identificador do fluxo de números aleatórios usado na geração das paisagens
+LANDSCAPE_STREAM = 1
+
+# formato dos arquivos da biblioteca: incrementar sempre que a forma de guardar a paisagem
+# mudar (as entradas antigas deixam de ser encontradas e saem pela remoção LRU)
+STORAGE_VERSION = 2
+
+
+def landscape_rng(seed):
+    """ gerador usado na geração da paisagem agregada de seed, independente do gerador da simulação """
+
+    return default_rng([seed, LANDSCAPE_STREAM])
+
+
+def landscape_key(p, q00, L, R, boundary, seed, inicial_patch_quality, iterations, backend, method='hiebeler',
+                  patience=None, temperature=0.0, cooling=events.COOLING, boundary_bias=events.BOUNDARY_BIAS,
+                  blocks=events.CHECKERBOARD_BLOCKS, workers=None):
+    """
+    parâmetros e hash que identificam uma paisagem da biblioteca
+
+    Só entram os parâmetros que mudam a paisagem: workers nunca entra, e o campo gaussiano
+    não depende da vizinhança, do backend nem do controle do gerador de Hiebeler.
+    """
+
+    params = {'p': p, 'q00': q00, 'L': L, 'seed': seed, 'inicial_patch_quality': inicial_patch_quality,
+              'method': method, 'generator_version': events.GENERATOR_VERSION, 'storage_version': STORAGE_VERSION}
+    if method != 'gaussian':
+        params.update(R=R, boundary=boundary, iterations=iterations, backend=backend, patience=patience,
+                      temperature=temperature, cooling=cooling, boundary_bias=boundary_bias)
+    if method == 'checkerboard':
+        params['blocks'] = blocks
+    description = json.dumps(params, sort_keys=True)
+
+    return params, hashlib.sha256(description.encode()).hexdigest()
+
+
+class LandscapeLibrary:
+    """
+    biblioteca de paisagens agregadas em disco, com remoção LRU por tamanho
+
+    Vários processos podem usar a mesma biblioteca: cada paisagem é escrita em um
+    arquivo próprio (com os.replace) e cada leitura, alteração e gravação do índice é
+    feita com a trava de index.lock (ver locked). Antes de cada remoção o índice é
+    conciliado com os arquivos do diretório: arquivos sem entrada (de uma gravação
+    interrompida, ou de processos sem trava) passam a contar para max_bytes e podem ser
+    removidos, e uma entrada cujo arquivo sumiu é descartada (a paisagem é gerada de novo).
+
+    Parameters
+    ----------
+    directory : str, optional
+        diretório da biblioteca. The default is LIBRARY_DIR.
+
+    max_bytes : int, optional
+        tamanho máximo da biblioteca. The default is MAX_BYTES.
+
+    """
+
+    def __init__(self, directory=LIBRARY_DIR, max_bytes=MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock_path = os.path.join(directory, 'index.lock')
+
+    @contextlib.contextmanager
+    def locked(self):
+        """ acesso exclusivo ao índice entre processos (fcntl.flock); sem fcntl, sem trava """
+
+        with open(self.lock_path, 'a') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def read_index(self):
+        """ {hash: {'file', 'bytes', 'last_used', 'params'}} """
+
+        try:
+            with open(self.index_path) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_index(self, index):
+        temp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump(index, handle)
+        os.replace(temp_path, self.index_path)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def get(self, key):
+        """ paisagem guardada com o hash key, ou None """
+
+        try:
+            with np.load(self.path(key)) as stored:
+                landscape = unpack_landscape(stored['packed'], tuple(stored['shape']))
+        except FileNotFoundError:
+            return None
+
+        with self.locked():
+            index = self.read_index()
+            if key in index:
+                index[key]['last_used'] = time.time()
+                self.write_index(index)
+
+        return landscape
+
+    def put(self, key, landscape, params):
+        """ guarda landscape com o hash key e remove as paisagens mais antigas se necessário """
+
+        path = self.path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temp_path, packed=pack_landscape(landscape), shape=np.shape(landscape))
+        os.replace(temp_path, path)
+
+        with self.locked():
+            index = self.read_index()
+            index[key] = {'file': os.path.basename(path), 'bytes': os.path.getsize(path),
+                          'last_used': time.time(), 'params': params}
+            self.evict(index, keep=key)
+            self.write_index(index)
+
+    def evict(self, index, keep=None):
+        """ remove de index (e do disco) as paisagens usadas há mais tempo até caber em max_bytes """
+
+        # conciliação com o diretório: os arquivos são <hash>.npz (os temporários têm outro nome)
+        stored = {name[:-4] for name in os.listdir(self.directory)
+                  if name.endswith('.npz') and len(name) == 68 and '.' not in name[:-4]}
+        for key in set(index) - stored - {keep}:
+            del index[key]
+        for key in stored - set(index):
+            path = self.path(key)
+            try:
+                index[key] = {'file': os.path.basename(path), 'bytes': os.path.getsize(path),
+                              'last_used': os.path.getmtime(path), 'params': None}
+            except FileNotFoundError:
+                pass
+
+        total = sum(entry['bytes'] for entry in index.values())
+
+        for key in sorted(index, key=lambda key: index[key]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index.pop(key)['bytes']
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def clustered_disturbance(self, landscape, p, q00, seed, neighbor_index, iterations=1000000, backend=None,
+                              stats=None, method='hiebeler', **options):
+        """
+        distúrbio agregado inicial, lido da biblioteca ou gerado e guardado
+
+        Parameters
+        ----------
+        landscape : numpy array
+            paisagem antes do distúrbio; só paisagens uniformes (todos os patches com a
+            qualidade inicial) são guardadas, as demais são apenas geradas
+
+        p, q00, neighbor_index, iterations, backend, stats
+            ver events.clustered_disturbance; stats só é preenchido quando a paisagem é gerada
+
+        method : str, optional
+            'hiebeler' (events.clustered_disturbance), 'checkerboard'
+            (events.checkerboard_disturbance) ou 'gaussian' (events.gaussian_disturbance).
+            The default is 'hiebeler'.
+
+        **options
+            patience, temperature, cooling e boundary_bias (ver events.clustered_disturbance)
+            e, com 'checkerboard', blocks, que também identificam a paisagem, e workers
+
+        seed : int
+            seed da paisagem (ver landscape_rng)
+
+        Returns
+        -------
+        landscape : numpy array
+            paisagem pós-distúrbio
+
+        """
+
+        def generate():
+            if method == 'gaussian':
+                return events.gaussian_disturbance(landscape_rng(seed), landscape, p, q00, stats)
+            if method == 'checkerboard':
+                return events.checkerboard_disturbance(landscape_rng(seed), landscape, p, q00, neighbor_index,
+                                                       iterations, backend, stats, **options)
+            return events.clustered_disturbance(landscape_rng(seed), landscape, p, q00, neighbor_index,
+                                                iterations, backend, stats, **options)
+
+        quality = np.ravel(landscape)[0]
+        if np.any(landscape != quality):
+            return generate()
+
+        backend = events.BACKEND if backend is None else backend
+        params, key = landscape_key(p, q00, neighbor_index.L, neighbor_index.R, neighbor_index.boundary, seed,
+                                    int(quality), iterations, backend, method, **options)
+
+        disturbed = self.get(key)
+        if disturbed is None:
+            disturbed = generate()
+            self.put(key, disturbed, params)
+
+        return disturbed.astype(np.asarray(landscape).dtype)
+
+
+def build(directory, p, q00, L, seed, R, inicial_patch_quality, iterations, max_bytes, options):
+    """ gera (se ainda não estiver na biblioteca) uma paisagem; usada pelos processos de prebuild """
+
+    library = LandscapeLibrary(directory, max_bytes)
+    library.clustered_disturbance(np.full((L, L), inicial_patch_quality, dtype=int), p, q00, seed,
+                                  neighbors.cached_neighbor_index(L, R), iterations, **options)
+
+
+def prebuild(ps, q00s, L, seeds, directory=LIBRARY_DIR, R=3, inicial_patch_quality=2, iterations=1000000,
+             max_bytes=MAX_BYTES, processes=None, **options):
+    """
+    pré-constrói a biblioteca para todas as combinações de p, q00 e seed, em paralelo
+
+    Parameters
+    ----------
+    ps, q00s, seeds : sequence
+        valores de p, q00 e seed
+
+    L : int
+        lado da paisagem
+
+    directory : str, optional
+        diretório da biblioteca. The default is LIBRARY_DIR.
+
+    R : int or real, optional
+        raio da vizinhança. The default is 3.
+
+    inicial_patch_quality : int, optional
+        qualidade inicial dos patches. The default is 2.
+
+    iterations : int, optional
+        número máximo de propostas do gerador de Hiebeler. The default is 1000000.
+
+    max_bytes : int, optional
+        tamanho máximo da biblioteca. The default is MAX_BYTES.
+
+    processes : int, optional
+        número de processos. The default is None (número de CPUs).
+
+    **options
+        method e, para 'hiebeler' e 'checkerboard', patience, temperature, cooling,
+        boundary_bias, blocks e workers (ver LandscapeLibrary.clustered_disturbance)
+
+    """
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(build, directory, p, q00, L, seed, R, inicial_patch_quality, iterations, max_bytes,
+                               options)
+                   for p, q00, seed in itertools.product(ps, q00s, seeds)]
+        for future in futures:
+            future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--p', type=float, nargs='+', required=True)
+    parser.add_argument('--q00', type=float, nargs='+', required=True)
+    parser.add_argument('--size', type=int, default=50, help='lado L da paisagem')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[12456789])
+    parser.add_argument('--quality', type=int, default=2, help='qualidade inicial dos patches')
+    parser.add_argument('--iterations', type=int, default=1000000)
+    parser.add_argument('--method', default='hiebeler', choices=('hiebeler', 'checkerboard', 'gaussian'))
+    parser.add_argument('--temperature', type=float, default=0.0, help='temperatura inicial do recozimento simulado')
+    parser.add_argument('--directory', default=LIBRARY_DIR)
+    parser.add_argument('--max-bytes', type=int, default=MAX_BYTES)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    prebuild(args.p, args.q00, args.size, args.seeds, args.directory, inicial_patch_quality=args.quality,
+             iterations=args.iterations, max_bytes=args.max_bytes, processes=args.processes,
+             method=args.method, temperature=args.temperature)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+from collections import namedtuple
+
+import numpy as np
+
+
+# diretório padrão do cache em disco dos índices de vizinhança
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'neighbors_cache')
+
+BOUNDARIES = ('fixed', 'periodic')
+
+NeighborIndex = namedtuple('NeighborIndex', ['L', 'R', 'boundary', 'offsets', 'targets', 'dist'])
+NeighborIndex.__doc__ = """
+índice de vizinhança no formato CSR (compressed sparse row)
+
+os vizinhos do patch de índice plano i * L + j são targets[offsets[i * L + j]:offsets[i * L + j + 1]],
+a distâncias euclidianas dist[offsets[i * L + j]:offsets[i * L + j + 1]]; o próprio patch
+(distância 0) é incluído
+"""
+
+
+def stencil(R):
+    """
+    deslocamentos (dx, dy) da vizinhança de raio R
+
+    A ordem é a mesma da tabela original neighbors_L=50_R=3.txt: por distância de
+    Manhattan crescente e, dentro dela, dx = m, ..., 1, -m, ..., -1, 0 com dy positivo
+    antes do negativo.
+
+    Parameters
+    ----------
+    R : int or real
+        raio da vizinhança
+
+    Returns
+    -------
+    dx, dy : numpy array
+        deslocamentos com dx ** 2 + dy ** 2 <= R ** 2
+
+    """
+
+    reach = int(np.floor(R))
+    dx, dy = [], []
+
+    for manhattan in range(2 * reach + 1):
+        for x in list(range(manhattan, 0, -1)) + list(range(-manhattan, 0)) + [0]:
+            rest = manhattan - abs(x)
+            for y in ([rest, -rest] if rest else [0]):
+                if x * x + y * y <= R * R:
+                    dx.append(x)
+                    dy.append(y)
+
+    return np.array(dx), np.array(dy)
+
+
+def build_neighbor_index(L, R, boundary='fixed', chunk_rows=256):
+    """
+    constrói o índice de vizinhança de uma paisagem L x L
+
+    Parameters
+    ----------
+    L : int
+        lado da paisagem
+
+    R : int or real
+        raio da vizinhança
+
+    boundary : str, optional
+        'fixed' (patches da borda têm menos vizinhos) ou 'periodic' (toroidal). The default is 'fixed'.
+
+    chunk_rows : int, optional
+        número de linhas da paisagem processadas por vez, limita a memória temporária. The default is 256.
+
+    Returns
+    -------
+    neighbor_index : NeighborIndex
+        índice de vizinhança
+
+    """
+
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"borda desconhecida: {boundary}")
+
+    dx, dy = stencil(R)
+    dist = np.sqrt(dx * dx + dy * dy).astype(np.float32)
+    index_dtype = np.int32 if L * L < 2 ** 31 else np.int64
+
+    degree = np.empty(L * L, dtype=np.int64)
+    targets = []
+    distances = []
+
+    for row in range(0, L, chunk_rows):
+        i, j = np.divmod(np.arange(row * L, min(row + chunk_rows, L) * L), L)
+        x = i[:, None] + dx
+        y = j[:, None] + dy
+
+        if boundary == 'periodic':
+            valid = np.ones(x.shape, dtype=bool)
+            x %= L
+            y %= L
+        else:
+            valid = (x >= 0) & (x < L) & (y >= 0) & (y < L)
+
+        degree[row * L:row * L + i.size] = valid.sum(axis=1)
+        targets.append((x * L + y)[valid].astype(index_dtype))
+        distances.append(np.broadcast_to(dist, valid.shape)[valid])
+
+    offsets = np.zeros(L * L + 1, dtype=np.int64)
+    np.cumsum(degree, out=offsets[1:])
+
+    return NeighborIndex(L, R, boundary, offsets, np.concatenate(targets), np.concatenate(distances))
+
+
+def load_neighbor_index(L, R, boundary='fixed', cache_dir=None):
+    """
+    retorna o índice de vizinhança, lendo do cache em disco ou construindo e salvando
+
+    Parameters
+    ----------
+    L : int
+        lado da paisagem
+
+    R : int or real
+        raio da vizinhança
+
+    boundary : str, optional
+        'fixed' ou 'periodic'. The default is 'fixed'.
+
+    cache_dir : str, optional
+        diretório do cache. The default is CACHE_DIR.
+
+    Returns
+    -------
+    neighbor_index : NeighborIndex
+        índice de vizinhança
+
+    """
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    path = os.path.join(cache_dir, f'neighbors_L={L}_R={R}_{boundary}.npz')
+
+    if os.path.exists(path):
+        with np.load(path) as stored:
+            return NeighborIndex(L, R, boundary, stored['offsets'], stored['targets'], stored['dist'])
+
+    neighbor_index = build_neighbor_index(L, R, boundary)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(temp_path, offsets=neighbor_index.offsets, targets=neighbor_index.targets,
+             dist=neighbor_index.dist)
+    os.replace(temp_path, path)
+
+    return neighbor_index
+
+
+@functools.lru_cache(maxsize=None)
+def cached_neighbor_index(L, R, boundary='fixed'):
+    """
+    índice de vizinhança compartilhado dentro do processo
+
+    Lido (ou construído) com load_neighbor_index apenas na primeira chamada com
+    (L, R, boundary); as chamadas seguintes devolvem o mesmo índice, com os arrays
+    marcados como somente leitura.
+
+    """
+
+    neighbor_index = load_neighbor_index(L, R, boundary)
+    for array in (neighbor_index.offsets, neighbor_index.targets, neighbor_index.dist):
+        array.setflags(write=False)
+
+    return neighbor_index
+
+
+def owners(neighbor_index, positions=None):
+    """ índice plano do patch de origem de cada entrada de targets (ou só das entradas em positions) """
+
+    if positions is None:
+        return np.repeat(np.arange(neighbor_index.L * neighbor_index.L), np.diff(neighbor_index.offsets))
+
+    return np.searchsorted(neighbor_index.offsets, positions, side='right') - 1
+
+
+def neighborhood(neighbor_index, patches):
+    """ índices planos, sem repetição e em ordem crescente, dos vizinhos (incluindo os próprios) de patches """
+
+    start = neighbor_index.offsets[patches]
+    degree = neighbor_index.offsets[patches + 1] - start
+    positions = np.repeat(start - np.cumsum(degree) + degree, degree) + np.arange(degree.sum())
+
+    return np.unique(neighbor_index.targets[positions])
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Validação das opções de precisão (float32, paisagem int8, paisagem empacotada) contra float64.
+
+simulation.simulate aceita population_dtype ('float64' ou 'float32'), landscape_dtype
+(qualquer tipo inteiro, como 'int8') e packed_landscape (paisagem do histórico com 2 bits
+por patch, ver history.pack_landscape). Os tipos são usados no estado, em todos os
+kernels de events.py e no histórico gravado (np.savez ou StreamingWriter). Em paisagens
+grandes o laço de gerações é limitado pela banda de memória: com float32 e int8, as
+populações ocupam metade e a paisagem um oitavo dos bytes.
+
+A paisagem inteira e a empacotada não mudam os resultados, que continuam idênticos bit
+a bit. Com float32 os resultados mudam: os grupos de migrantes dependem do arredondamento
+das populações e, a partir da primeira diferença, os sorteios das duas simulações (e os
+eventos seguintes do cronograma) divergem. Por isso compare simula várias seeds em cada
+configuração e compara as médias entre seeds dos campos médios, além de contar as seeds
+cujas trajetórias divergiram.
+
+Uso:
+    python precision.py --scenario 2 --size 100 --generations 100 --seeds 1 2 3 4 5
+    python precision.py --population-dtype float32 --landscape-dtype int8 --packed-landscape
+
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import simulation
+from history import unpack_landscape
+from streams import RandomStreams
+
+# diferença relativa máxima aceita entre as médias entre seeds dos campos médios
+TOLERANCE = 0.05
+
+# configuração de referência
+REFERENCE = {'population_dtype': 'float64', 'landscape_dtype': 'int64', 'packed_landscape': False}
+
+
+def run(scenario, seeds, options, schedule_params, params):
+    """ histórico (mean_nat, mean_exo, natpop, exopop, landscape) das seeds em lote, com a paisagem desempacotada """
+
+    rngs = [RandomStreams(seed) for seed in seeds]
+    total_num_generations = params.get('total_num_generations', 100)
+    schedules = [simulation.scenario_schedule(scenario, rng['schedule'], total_num_generations, **schedule_params)
+                 for rng in rngs]
+    history = simulation.simulate(rngs, schedules, **params, **options, landscape_seed=list(seeds))
+
+    mean_nat, mean_exo, natpop, exopop, landscape, _ = history.arrays()
+    if options.get('packed_landscape'):
+        landscape = unpack_landscape(landscape, params.get('matrix_size', (50, 50)))
+
+    return mean_nat, mean_exo, natpop, exopop, landscape
+
+
+def relative_difference(values, reference):
+    """ maior diferença absoluta relativa ao maior valor da referência """
+
+    return float(np.max(np.abs(values - reference)) / max(np.max(np.abs(reference)), 1.0))
+
+
+def compare(scenario, seeds, population_dtype='float32', landscape_dtype='int8', packed_landscape=False,
+            schedule_params=None, **params):
+    """
+    compara uma configuração de precisão com a referência float64 nas mesmas seeds
+
+    Parameters
+    ----------
+    scenario : int
+        número do cenário (1 a 4), usado para o cronograma (ver simulation.scenario_schedule)
+
+    seeds : sequence of int
+        seeds simuladas em cada configuração (em lote, ver simulation.simulate)
+
+    population_dtype, landscape_dtype, packed_landscape
+        configuração testada (ver simulation.simulate)
+
+    schedule_params : dict, optional
+        rec_time, dist_time e total_dist do cronograma. The default is None.
+
+    **params
+        demais argumentos de simulation.simulate
+
+    Returns
+    -------
+    report : dict
+        'mean_nat' e 'mean_exo': maior diferença, relativa ao máximo da referência, entre as
+        médias entre seeds dos campos médios; 'identical': seeds com o histórico idêntico ao
+        da referência; 'bytes': bytes do estado por geração na configuração e na referência
+
+    """
+
+    schedule_params = schedule_params or {}
+    options = {'population_dtype': population_dtype, 'landscape_dtype': landscape_dtype,
+               'packed_landscape': packed_landscape}
+
+    reference = run(scenario, seeds, REFERENCE, schedule_params, params)
+    candidate = run(scenario, seeds, options, schedule_params, params)
+
+    report = {name: relative_difference(np.mean(values, axis=0), np.mean(expected, axis=0))
+              for name, values, expected in zip(('mean_nat', 'mean_exo'), candidate, reference)}
+    report['identical'] = int(sum(all(np.array_equal(values[replicate], expected[replicate])
+                                      for values, expected in zip(candidate, reference))
+                                  for replicate in range(len(seeds))))
+
+    L, _ = params.get('matrix_size', (50, 50))
+    report['bytes'] = {name: L * L * (2 * np.dtype(config['population_dtype']).itemsize
+                                      + np.dtype(config['landscape_dtype']).itemsize)
+                       for name, config in (('candidate', options), ('reference', REFERENCE))}
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', type=int, default=2, choices=(1, 2, 3, 4))
+    parser.add_argument('--size', type=int, default=50, help='lado L da paisagem')
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--seeds', type=int, nargs='+', default=list(range(1, 11)))
+    parser.add_argument('--population-dtype', default='float32', choices=simulation.POPULATION_DTYPES)
+    parser.add_argument('--landscape-dtype', default='int8')
+    parser.add_argument('--packed-landscape', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    schedule_params = {2: {'rec_time': 5}, 3: {'rec_time': 5, 'dist_time': 5},
+                       4: {'rec_time': 5, 'total_dist': 5}}.get(args.scenario, {})
+    params = {'p': 0.5, 'native_migration_rate': 0.2, 'exotic_migration_rate': 0.2,
+              'pr': 0.2 if args.scenario > 1 else None, 'matrix_size': (args.size, args.size),
+              'total_num_generations': args.generations}
+
+    report = compare(args.scenario, args.seeds, args.population_dtype, args.landscape_dtype, args.packed_landscape,
+                     schedule_params, **params)
+    worst = max(report['mean_nat'], report['mean_exo'])
+    print(f"campo médio (média de {len(args.seeds)} seeds): diferença relativa {worst:.2e}")
+    print(f"seeds idênticas à referência: {report['identical']} de {len(args.seeds)}")
+    print(f"bytes do estado: {report['bytes']['candidate'] / report['bytes']['reference']:.0%} da referência")
+
+    # sem float32 os resultados devem ser idênticos
+    exact = np.dtype(args.population_dtype) == np.dtype(REFERENCE['population_dtype'])
+    if worst > args.tolerance or (exact and report['identical'] < len(args.seeds)):
+        print("FALHOU")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
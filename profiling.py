@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação do laço de gerações: tempo (e alocações) de cada etapa por geração.
+
+simulation.simulate(..., profiler=Profiler()) mede cada etapa da geração (capacidade
+de suporte, Lotka-Volterra, breque, migração, eventos do cronograma, campo médio,
+gravação) e guarda estatísticas dos eventos, como o número de iterações e a taxa de
+aceitação do distúrbio agregado. Sem profiler, o laço usa um contexto nulo e o custo
+é desprezível.
+
+Exemplo:
+    profiler = Profiler(memory=True)
+    simulation.simulate(rng, schedule, 0.5, 0.2, 0.2, profiler=profiler)
+    profiler.to_json('perfil.json')
+    profiler.to_csv('perfil.csv')
+
+"""
+
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+# contexto usado no lugar de Profiler.section quando não há profiler
+NULL_SECTION = contextlib.nullcontext()
+
+
+def null_section(name, gen):
+    return NULL_SECTION
+
+
+class Profiler:
+    """
+    cronômetro por etapa do laço de gerações
+
+    Parameters
+    ----------
+    memory : bool, optional
+        se as alocações de cada etapa também são medidas com tracemalloc (mais lento).
+        The default is False.
+
+    per_generation : bool, optional
+        se cada medição (geração, etapa, tempo, memória) é guardada, além dos totais.
+        The default is False.
+
+    callbacks : sequence of callable, optional
+        funções chamadas ao fim de cada etapa como callback(gen, name, seconds, allocated);
+        allocated é None sem memory. The default is ().
+
+    """
+
+    def __init__(self, memory=False, per_generation=False, callbacks=()):
+        self.memory = memory
+        self.per_generation = per_generation
+        self.callbacks = list(callbacks)
+        self.sections = {}
+        self.stats = {}
+        self.rows = []
+
+        self.started_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def section(self, name, gen):
+        """ mede o bloco with como a etapa name da geração gen """
+
+        if self.memory:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+
+        yield
+
+        seconds = time.perf_counter() - start
+        allocated = tracemalloc.get_traced_memory()[1] - current if self.memory else None
+        self.add(gen, name, seconds, allocated)
+
+    def add(self, gen, name, seconds, allocated=None):
+        """ acumula uma medição da etapa name """
+
+        section = self.sections.setdefault(name, {'calls': 0, 'seconds': 0.0, 'min_seconds': float('inf'),
+                                                  'max_seconds': 0.0, 'peak_bytes': 0})
+        section['calls'] += 1
+        section['seconds'] += seconds
+        section['min_seconds'] = min(section['min_seconds'], seconds)
+        section['max_seconds'] = max(section['max_seconds'], seconds)
+        if allocated is not None:
+            section['peak_bytes'] = max(section['peak_bytes'], allocated)
+
+        if self.per_generation:
+            self.rows.append({'generation': gen, 'section': name, 'seconds': seconds, 'allocated': allocated})
+        for callback in self.callbacks:
+            callback(gen, name, seconds, allocated)
+
+    def record_stats(self, name, **values):
+        """ acumula contadores de um evento (por exemplo iterations e accepted do distúrbio agregado) """
+
+        stats = self.stats.setdefault(name, {'calls': 0})
+        stats['calls'] += 1
+        for key, value in values.items():
+            stats[key] = stats.get(key, 0) + value
+
+    def summary(self):
+        """
+        resumo agregado
+
+        Returns
+        -------
+        summary : dict
+            {'sections': {etapa: calls, seconds, mean_seconds, min_seconds, max_seconds,
+            peak_bytes, fraction}, 'stats': {evento: contadores somados e, quando houver
+            iterations e accepted, acceptance_rate}}
+
+        """
+
+        total = sum(section['seconds'] for section in self.sections.values())
+        sections = {}
+        for name, section in self.sections.items():
+            sections[name] = {**section, 'mean_seconds': section['seconds'] / section['calls'],
+                              'fraction': section['seconds'] / total if total else 0.0}
+
+        stats = {}
+        for name, values in self.stats.items():
+            stats[name] = dict(values)
+            if values.get('iterations'):
+                stats[name]['acceptance_rate'] = values.get('accepted', 0) / values['iterations']
+
+        return {'sections': sections, 'stats': stats}
+
+    def to_json(self, path):
+        """ grava o resumo (e as medições por geração, se guardadas) em JSON """
+
+        summary = self.summary()
+        if self.per_generation:
+            summary['rows'] = self.rows
+
+        with open(path, 'w') as handle:
+            json.dump(summary, handle, indent=1)
+
+    def to_csv(self, path):
+        """ grava o resumo das etapas em CSV, uma linha por etapa """
+
+        fields = ['section', 'calls', 'seconds', 'mean_seconds', 'min_seconds', 'max_seconds', 'peak_bytes',
+                  'fraction']
+
+        with open(path, 'w', newline='') as handle:
+            writer = csv.DictWriter(handle, fields)
+            writer.writeheader()
+            for name, section in self.summary()['sections'].items():
+                writer.writerow({'section': name, **section})
+
+    def close(self):
+        """ encerra o tracemalloc, se iniciado por este profiler """
+
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
@@ -0,0 +1,750 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+
+import numpy as np
+
+import events
+import neighbors
+import checkpoint
+import streams
+from history import HistoryRecorder, StreamingWriter
+from landscapes import LandscapeLibrary
+from profiling import null_section
+
+# raio da vizinhança
+R = 3
+
+# ordem de aplicação dos eventos dentro de uma mesma geração
+EVENT_ORDER = ('initial_disturbance', 'invasion', 'restoration', 'disturbance')
+
+# políticas de término antecipado (ver simulate)
+TERMINATIONS = ('stop', 'fast_forward')
+
+# fração máxima de patches ocupados para que uma espécie seja processada só nos patches ativos
+SPARSE_OCCUPANCY = 0.1
+
+# geradores do distúrbio inicial agregado: Hiebeler (events.clustered_disturbance), Hiebeler
+# paralelizado por subredes (events.checkerboard_disturbance) ou campo gaussiano limiarizado
+# (events.gaussian_disturbance), e o nome das suas estatísticas no profiler
+CLUSTERED_METHODS = {'hiebeler': 'clustered_disturbance', 'checkerboard': 'checkerboard_disturbance',
+                     'gaussian': 'gaussian_disturbance'}
+
+# tipos aceitos para as populações (a paisagem aceita qualquer tipo inteiro)
+POPULATION_DTYPES = ('float64', 'float32')
+
+
+class EventSchedule:
+    """
+    cronograma de eventos pré-compilado
+
+    As gerações com eventos ficam em um vetor ordenado; a simulação percorre o
+    cronograma com um ponteiro em vez de testar cada evento em todas as gerações.
+
+    Parameters
+    ----------
+    gens : numpy array
+        gerações com algum evento, em ordem crescente e sem repetição
+
+    events : list of tuple
+        nomes dos eventos de cada geração de gens, na ordem de EVENT_ORDER
+
+    """
+
+    def __init__(self, gens, events):
+        self.gens = gens
+        self.events = events
+
+    def __len__(self):
+        return len(self.gens)
+
+    def __iter__(self):
+        return zip(self.gens.tolist(), self.events)
+
+    def last_gen(self, event=None):
+        """ última geração com evento (ou com o evento event); 0 se não houver """
+
+        gens = [gen for gen, events in self if event is None or event in events]
+
+        return gens[-1] if gens else 0
+
+
+def compile_schedule(total_num_generations, event_gens):
+    """
+    compila o cronograma de eventos
+
+    Parameters
+    ----------
+    total_num_generations : int
+        número total de gerações; eventos fora de 1, ..., total_num_generations - 1 são descartados
+
+    event_gens : dict
+        gerações de cada evento, {nome do evento: sequência de gerações}; nomes em EVENT_ORDER
+
+    Returns
+    -------
+    schedule : EventSchedule
+        cronograma compilado
+
+    """
+
+    unknown = set(event_gens) - set(EVENT_ORDER)
+    if unknown:
+        raise ValueError(f"eventos desconhecidos: {sorted(unknown)}")
+
+    timeline = {}
+    for name in EVENT_ORDER:
+        for gen in np.unique(np.asarray(event_gens.get(name, ()), dtype=int)).tolist():
+            if 1 <= gen < total_num_generations:
+                timeline.setdefault(gen, []).append(name)
+
+    gens = np.array(sorted(timeline), dtype=int)
+
+    return EventSchedule(gens, [tuple(timeline[gen]) for gen in gens.tolist()])
+
+
+def every(interval, total_num_generations):
+    """ gerações interval, 2 * interval, ... anteriores a total_num_generations """
+
+    return range(interval, total_num_generations, interval)
+
+
+def scenario_schedule(scenario, rng, total_num_generations, rec_time=None, dist_time=None, total_dist=None):
+    """
+    cronograma de eventos de cada cenário
+
+    cenário 1: t = 1, distúrbio inicial e invasão;
+    cenário 2: além disso, restauração a cada rec_time;
+    cenário 3: além disso, distúrbio a cada dist_time;
+    cenário 4: restauração a cada rec_time e distúrbio em total_dist t aleatórios (sorteados com rng)
+
+    Parameters
+    ----------
+    scenario : int
+        número do cenário (1 a 4)
+
+    rng : Generator
+        gerador de números pseudo-aleatórios, usado apenas pelo cenário 4
+
+    total_num_generations : int
+        número total de gerações
+
+    rec_time, dist_time, total_dist : int, optional
+        parâmetros dos cenários 2 a 4
+
+    Returns
+    -------
+    schedule : EventSchedule
+        cronograma compilado
+
+    """
+
+    event_gens = {'initial_disturbance': [1], 'invasion': [1]}
+
+    if scenario in (2, 3, 4):
+        event_gens['restoration'] = every(rec_time, total_num_generations)
+
+    if scenario == 3:
+        event_gens['disturbance'] = every(dist_time, total_num_generations)
+    elif scenario == 4:
+        event_gens['disturbance'] = rng.integers(2, 100, size=total_dist)
+    elif scenario not in (1, 2):
+        raise ValueError(f"cenário desconhecido: {scenario}")
+
+    return compile_schedule(total_num_generations, event_gens)
+
+
+def update_active(pop, active, sparse_occupancy):
+    """
+    patches ativos (ocupados) de uma espécie, como índices planos no lote de réplicas
+
+    Parameters
+    ----------
+    pop : numpy array
+        população, shape (n_replicates, *matrix_size)
+
+    active : numpy array or None
+        patches ativos anteriores (possivelmente incluindo patches vazios), ou None se a
+        espécie estava no caminho denso
+
+    sparse_occupancy : float
+        fração máxima de patches ocupados para o caminho esparso
+
+    Returns
+    -------
+    active : numpy array or None
+        patches ocupados em ordem crescente, ou None quando a ocupação é alta (caminho denso)
+
+    """
+
+    limit = sparse_occupancy * pop.size
+
+    if active is not None:
+        active = active[pop.reshape(-1)[active] > 0]
+        return active if active.size <= limit else None
+
+    if np.count_nonzero(pop) <= limit:
+        return np.flatnonzero(pop)
+
+    return None
+
+
+def on_active(active, function, pop, *args):
+    """
+    aplica a função elemento a elemento function(pop, *args), só nos patches ativos se houver
+
+    Fora dos patches ativos a população é 0 e continua 0 em todos os kernels de uma
+    geração. No caminho esparso pop é atualizado no lugar; os argumentos com o shape
+    de pop são indexados pelos patches ativos e os demais são passados inteiros.
+    """
+
+    if active is None:
+        return function(pop, *args)
+
+    values = [np.reshape(arg, -1)[active] if np.shape(arg) == np.shape(pop) else arg for arg in args]
+    pop.reshape(-1)[active] = function(pop.reshape(-1)[active], *values)
+
+    return pop
+
+
+def replicate_patches(active, replicate, patches_per_replicate):
+    """ fatia de active da réplica replicate e os índices planos dentro da réplica """
+
+    lo, hi = np.searchsorted(active, [replicate * patches_per_replicate, (replicate + 1) * patches_per_replicate])
+
+    return slice(lo, hi), active[lo:hi] - replicate * patches_per_replicate
+
+
+def expand_active(active, neighbor_index, replicates):
+    """ patches ativos mais os seus vizinhos, que podem ter recebido migrantes """
+
+    patches_per_replicate = neighbor_index.L * neighbor_index.L
+    expanded = []
+    for replicate in range(replicates):
+        _, patches = replicate_patches(active, replicate, patches_per_replicate)
+        if patches.size:
+            expanded.append(neighbors.neighborhood(neighbor_index, patches) + replicate * patches_per_replicate)
+
+    return np.concatenate(expanded) if expanded else active
+
+
+def simulate(rng, schedule, p, native_migration_rate, exotic_migration_rate, pr=None,
+             inicial_disturbance_clustered=False, q00=None,
+             matrix_size=(50, 50), total_num_generations=100, alfa=0.8, beta=0.8, r_n=1, r_e=1,
+             inicial_native_population=500, inicial_patch_quality=2,
+             exotic_individuals_to_introduce=1000, migration_mode='individual',
+             output_file=None, output_dir=None, grid_stride=1, mean_stride=1,
+             landscape_library=None, landscape_seed=None, termination=None, tolerance=1e-3, patience=10,
+             sparse_occupancy=SPARSE_OCCUPANCY, profiler=None,
+             checkpoint_path=None, checkpoint_every=10, resume_state=None,
+             population_dtype=float, landscape_dtype=int, packed_landscape=False, clustered_options=None,
+             clustered_method='hiebeler'):
+    """
+    núcleo da simulação, comum a todos os cenários
+
+    A cada geração: capacidade de suporte, Lotka-Volterra, breque, migração e, nas
+    gerações do cronograma, os eventos ('initial_disturbance', 'invasion',
+    'restoration', 'disturbance'), seguidos do campo médio.
+
+    Com uma sequência de geradores (modo ensemble), as réplicas são simuladas juntas:
+    populações e paisagens têm shape (n_replicates, *matrix_size), os cálculos
+    determinísticos são feitos de uma vez para todas as réplicas e os eventos
+    estocásticos usam o gerador de cada réplica, na mesma ordem de uma simulação
+    isolada. A réplica i reproduz exatamente simulate(rng[i], schedule[i], ...).
+    A migração 'mean_field' é uma única convolução do lote e a 'multinomial' no backend
+    'numba' uma única chamada do kernel, com uma seed por réplica (ver
+    events.migracao_ensemble); os sorteios do distúrbio e da restauração são feitos com o
+    gerador de cada réplica e aplicados ao lote de uma vez. A migração 'individual' ou
+    'multinomial' em NumPy, a invasão e o distúrbio inicial continuam réplica a réplica.
+
+    Com termination, a simulação termina antes de total_num_generations quando:
+    - as duas espécies estão extintas e não há mais invasões no cronograma; ou
+    - não há mais eventos no cronograma e, por patience gerações seguidas, a paisagem não
+      mudou e as médias das duas espécies variaram no máximo tolerance * max(média, 1).
+    Com 'stop', o histórico termina na geração em que a condição foi atingida. Com
+    'fast_forward', as gerações restantes são gravadas sem os cálculos populacionais: após
+    a extinção só os eventos da paisagem são aplicados, e no estado estacionário o último
+    estado é repetido. No modo ensemble, a condição deve valer para todas as réplicas.
+    A geração e o motivo ficam em history.termination.
+
+    Uma espécie que ocupa no máximo sparse_occupancy dos patches (a exótica logo após a
+    invasão, a nativa após um distúrbio severo) é processada só nos patches ocupados, cujo
+    conjunto é mantido de uma geração para a outra (ocupados mais os vizinhos que podem
+    receber migrantes). Acima dessa ocupação volta-se ao caminho denso. Os dois caminhos
+    dão o mesmo resultado.
+
+    Parameters
+    ----------
+    rng : Generator, RandomStreams or sequence
+        Gerador de números pseudo-aleatórios, ou um por réplica. Com streams.RandomStreams,
+        cada tipo de evento (e a migração de cada espécie) sorteia do seu próprio fluxo.
+
+    schedule : EventSchedule or sequence of EventSchedule
+        Cronograma de eventos (ver compile_schedule), comum a todas as réplicas ou um por réplica.
+
+    p : float
+        Intensidade do distúrbio.
+
+    native_migration_rate : float
+        Taxa de migração da sp. nativa.
+
+    exotic_migration_rate : float
+        Taxa de migração da sp. exótica.
+
+    pr : float, optional
+        Intensidade da restauração. Necessário caso o cronograma tenha eventos 'restoration'.
+
+    output_file : str, optional
+        Arquivo .npz onde o histórico em memória é salvo ao final. The default is None (não salva).
+
+    landscape_library : str or LandscapeLibrary, optional
+        Biblioteca de paisagens agregadas (ver landscapes.LandscapeLibrary) consultada no distúrbio
+        inicial agregado. The default is None (a paisagem é gerada com o gerador da simulação).
+
+    landscape_seed : int or sequence of int, optional
+        Seed da paisagem agregada (uma por réplica no modo ensemble). Necessário com landscape_library.
+
+    termination : str, optional
+        Política de término antecipado, 'stop' ou 'fast_forward'. The default is None (sempre
+        simula total_num_generations gerações).
+
+    tolerance : float, optional
+        Variação relativa máxima das médias no estado estacionário. The default is 1e-3.
+
+    patience : int, optional
+        Número de gerações seguidas dentro da tolerância para o estado estacionário. The default is 10.
+
+    sparse_occupancy : float, optional
+        Fração máxima de patches ocupados para o processamento esparso; 0 desativa.
+        The default is SPARSE_OCCUPANCY.
+
+    profiler : profiling.Profiler, optional
+        Mede cada etapa de cada geração e as estatísticas do distúrbio agregado.
+        The default is None (sem instrumentação).
+
+    checkpoint_path : str, optional
+        Arquivo .npz onde o estado completo da simulação é gravado a cada checkpoint_every
+        gerações (ver checkpoint.py e resume); sem output_dir, o histórico em memória vai
+        para o diretório {checkpoint_path}.history. The default is None (sem checkpoints).
+
+    checkpoint_every : int, optional
+        Intervalo de gerações entre os checkpoints. Cada checkpoint grava o estado atual e só
+        as linhas do histórico novas desde o anterior (ver HistoryRecorder.checkpoint).
+        The default is 10.
+
+    resume_state : (dict, dict), optional
+        Estado lido de um checkpoint; uso interno de resume. The default is None.
+
+    population_dtype : dtype or str, optional
+        Tipo das populações no estado, nos kernels e no histórico, 'float64' ou 'float32'
+        (ver precision.py). The default is float.
+
+    landscape_dtype : dtype or str, optional
+        Tipo inteiro da paisagem no estado e no histórico, por exemplo 'int8'. The default is int.
+
+    packed_landscape : bool, optional
+        Se o histórico guarda a paisagem com history.pack_landscape, 2 bits por patch; exige
+        inicial_patch_quality <= 2. The default is False.
+
+    clustered_options : dict, optional
+        Argumentos do gerador agregado (iterations, patience, temperature, cooling,
+        boundary_bias; ver events.clustered_disturbance; com 'checkerboard', também workers e
+        blocks). The default is None (os padrões).
+
+    clustered_method : str, optional
+        Gerador do distúrbio inicial agregado, 'hiebeler', 'checkerboard' (Hiebeler em
+        paralelo por subredes; ver events.checkerboard_disturbance) ou 'gaussian' (campo
+        gaussiano limiarizado, O(N log N); ver events.gaussian_disturbance). The default is 'hiebeler'.
+
+    Os demais parâmetros são os mesmos dos cenários (ver cenário_1.scenario_1).
+
+    Returns
+    -------
+    history : HistoryRecorder or StreamingWriter
+        Histórico da simulação; no modo ensemble, com um eixo inicial de réplicas.
+
+    """
+
+    arguments = dict(p=p, native_migration_rate=native_migration_rate, exotic_migration_rate=exotic_migration_rate,
+                     pr=pr, inicial_disturbance_clustered=inicial_disturbance_clustered, q00=q00,
+                     matrix_size=list(matrix_size), total_num_generations=total_num_generations, alfa=alfa,
+                     beta=beta, r_n=r_n, r_e=r_e, inicial_native_population=inicial_native_population,
+                     inicial_patch_quality=inicial_patch_quality,
+                     exotic_individuals_to_introduce=exotic_individuals_to_introduce,
+                     migration_mode=migration_mode, output_file=output_file, output_dir=output_dir,
+                     grid_stride=grid_stride, mean_stride=mean_stride,
+                     landscape_library=getattr(landscape_library, 'directory', landscape_library),
+                     landscape_seed=landscape_seed, termination=termination, tolerance=tolerance,
+                     patience=patience, sparse_occupancy=sparse_occupancy, checkpoint_path=checkpoint_path,
+                     checkpoint_every=checkpoint_every)
+
+    population_dtype = np.dtype(population_dtype)
+    landscape_dtype = np.dtype(landscape_dtype)
+    if population_dtype.name not in POPULATION_DTYPES:
+        raise ValueError(f"tipo de população não suportado: {population_dtype}")
+    if landscape_dtype.kind not in 'iu':
+        raise ValueError(f"a paisagem deve ter tipo inteiro: {landscape_dtype}")
+    if packed_landscape and not 0 <= inicial_patch_quality <= 2:
+        raise ValueError("packed_landscape exige inicial_patch_quality entre 0 e 2")
+    arguments.update(population_dtype=population_dtype.name, landscape_dtype=landscape_dtype.name,
+                     packed_landscape=packed_landscape, clustered_options=clustered_options,
+                     clustered_method=clustered_method)
+    clustered_options = clustered_options or {}
+
+    ensemble = not isinstance(rng, (np.random.Generator, streams.RandomStreams))
+    rngs = list(rng) if ensemble else [rng]
+    if isinstance(schedule, EventSchedule):
+        schedules = [schedule] * len(rngs)
+    else:
+        schedules = list(schedule)
+    replicates = len(rngs)
+
+    if clustered_method not in CLUSTERED_METHODS:
+        raise ValueError(f"gerador agregado desconhecido: {clustered_method}")
+    if migration_mode not in events.MIGRATION_MODES:
+        raise ValueError(f"modo de migração desconhecido: {migration_mode}")
+    if termination is not None and termination not in TERMINATIONS:
+        raise ValueError(f"política de término desconhecida: {termination}")
+    last_event = max(replicate_schedule.last_gen() for replicate_schedule in schedules)
+    last_invasion = max(replicate_schedule.last_gen('invasion') for replicate_schedule in schedules)
+
+    if isinstance(landscape_library, str):
+        landscape_library = LandscapeLibrary(landscape_library)
+    if landscape_library is not None and landscape_seed is None:
+        raise ValueError("landscape_library requer landscape_seed")
+    landscape_seeds = list(landscape_seed) if np.ndim(landscape_seed) > 0 else [landscape_seed] * replicates
+
+    def state(batch):
+        """ estado a gravar: o lote inteiro no modo ensemble, a única réplica caso contrário """
+
+        return batch if ensemble else batch[0]
+
+    # vizinhança
+    if matrix_size[0] != matrix_size[1]:
+        raise ValueError("a paisagem deve ser quadrada (L, L)")
+    neighbor_index = neighbors.cached_neighbor_index(matrix_size[0], R)
+
+    # store
+    lead = replicates if ensemble else None
+    if output_dir is None:
+        history = HistoryRecorder(total_num_generations, matrix_size, population_dtype, landscape_dtype,
+                                  path=output_file, replicates=lead, packed_landscape=packed_landscape)
+    else:
+        history = StreamingWriter(output_dir, total_num_generations, matrix_size, grid_stride, mean_stride,
+                                  population_dtype, landscape_dtype, replicates=lead,
+                                  resume=resume_state is not None, packed_landscape=packed_landscape)
+
+    if resume_state is None:
+        # t = 0
+        landscape = np.full((replicates, *matrix_size), inicial_patch_quality, dtype=landscape_dtype)
+        native_population = np.full((replicates, *matrix_size), inicial_native_population, dtype=population_dtype)
+        exotic_population = np.zeros((replicates, *matrix_size), dtype=population_dtype)
+
+        nat_cm = np.mean(native_population, axis=(-2, -1))
+        exo_cm = np.mean(exotic_population, axis=(-2, -1))
+        history.record(0, state(native_population), state(exotic_population), state(landscape),
+                       state(nat_cm), state(exo_cm))
+
+        first_gen = 1
+        stable = 0
+        extinct = False
+        previous_landscape = landscape.copy()
+    else:
+        # estado do fim da geração do checkpoint
+        arrays, info = resume_state
+        landscape, native_population, exotic_population = (
+            arrays['landscape'], arrays['native_population'], arrays['exotic_population'])
+        nat_cm, exo_cm = arrays['nat_cm'], arrays['exo_cm']
+        previous_landscape = arrays['previous_landscape']
+        history.restore(arrays, info['history'], checkpoint_path)
+
+        first_gen = info['gen'] + 1
+        stable = info['stable']
+        extinct = info['extinct']
+
+    timelines = [iter(replicate_schedule) for replicate_schedule in schedules]
+    upcoming = [next(timeline, (None, ())) for timeline in timelines]
+    for replicate, timeline in enumerate(timelines):
+        while upcoming[replicate][0] is not None and upcoming[replicate][0] < first_gen:
+            upcoming[replicate] = next(timeline, (None, ()))
+
+    timer = null_section if profiler is None else profiler.section
+    nat_active = exo_active = None
+
+    for gen in range(first_gen, total_num_generations):
+
+        if not extinct:
+            # patches ativos de cada espécie (None: todos)
+            with timer('active_set', gen):
+                nat_active = update_active(native_population, nat_active, sparse_occupancy)
+                exo_active = update_active(exotic_population, exo_active, sparse_occupancy)
+
+            # atualizar capacidade de suporte (no caminho esparso, apenas dos patches ativos)
+            with timer('carrying_capacity', gen):
+                kn_array = events.kn_update(landscape if nat_active is None else landscape.reshape(-1)[nat_active],
+                                            population_dtype)
+                ke_array = events.ke_update(landscape if exo_active is None else landscape.reshape(-1)[exo_active],
+                                            population_dtype)
+
+            # lotka
+            with timer('lotka_volterra', gen):
+                native_population = on_active(nat_active, events.lotka_volterra, native_population,
+                                              exotic_population, r_n, alfa, kn_array)
+                exotic_population = on_active(exo_active, events.lotka_volterra, exotic_population,
+                                              native_population, r_e, beta, ke_array)
+
+            # breque
+            with timer('breque', gen):
+                native_population = on_active(nat_active, events.breque, native_population)
+                exotic_population = on_active(exo_active, events.breque, exotic_population)
+
+            # calcular migrantes (no caminho esparso, apenas dos patches ativos)
+            with timer('calc_migrantes', gen):
+                nat_migrantes = events.calc_migrantes(
+                    native_population if nat_active is None else native_population.reshape(-1)[nat_active],
+                    native_migration_rate)
+                exo_migrantes = events.calc_migrantes(
+                    exotic_population if exo_active is None else exotic_population.reshape(-1)[exo_active],
+                    exotic_migration_rate)
+
+            # migração
+            with timer('migracao', gen):
+                for population, migrantes, active, stream in (
+                        (native_population, nat_migrantes, nat_active, 'native_migration'),
+                        (exotic_population, exo_migrantes, exo_active, 'exotic_migration')):
+                    migration_rngs = [streams.event_rng(replicate_rng, stream) for replicate_rng in rngs]
+                    events.migracao_ensemble(migration_rngs, migrantes, population, neighbor_index,
+                                             migration_mode, patches=active)
+
+            # remover migrantes
+            with timer('remove_migrantes', gen):
+                native_population = on_active(nat_active, events.remove_migrantes, native_population,
+                                              nat_migrantes)
+                exotic_population = on_active(exo_active, events.remove_migrantes, exotic_population,
+                                              exo_migrantes)
+
+            # patches que podem ter recebido migrantes
+            with timer('active_set', gen):
+                if nat_active is not None:
+                    nat_active = expand_active(nat_active, neighbor_index, replicates)
+                if exo_active is not None:
+                    exo_active = expand_active(exo_active, neighbor_index, replicates)
+
+        # eventos do cronograma: a k-ésima posição da lista de eventos da geração de cada
+        # réplica é aplicada junto para todas as réplicas com o mesmo evento nessa posição;
+        # distúrbio e restauração atualizam essas réplicas de uma vez
+        due = [replicate for replicate in range(replicates) if upcoming[replicate][0] == gen]
+        for position in range(max((len(upcoming[replicate][1]) for replicate in due), default=0)):
+            grouped = {}
+            for replicate in due:
+                if position < len(upcoming[replicate][1]):
+                    grouped.setdefault(upcoming[replicate][1][position], []).append(replicate)
+
+            for event, members in grouped.items():
+                event_rngs = [streams.event_rng(rngs[replicate], event) for replicate in members]
+                with timer(event, gen):
+                    if event == 'restoration':
+                        landscape[members] = events.restoration(event_rngs, landscape[members], pr)
+
+                    elif event == 'disturbance':
+                        landscape[members] = events.random_disturbance(event_rngs, landscape[members], p)
+
+                    elif event == 'invasion':
+                        for replicate, event_rng in zip(members, event_rngs):
+                            exotic_population[replicate] = events.invasion(
+                                event_rng, landscape[replicate], exotic_population[replicate],
+                                exotic_individuals_to_introduce)
+                        exo_active = None
+
+                    elif event == 'initial_disturbance':
+                        for replicate, event_rng in zip(members, event_rngs):
+                            stats = {} if profiler is not None else None
+                            if inicial_disturbance_clustered and landscape_library is not None:
+                                landscape[replicate] = landscape_library.clustered_disturbance(
+                                    landscape[replicate], p, q00, landscape_seeds[replicate], neighbor_index,
+                                    stats=stats, method=clustered_method, **clustered_options)
+                            elif inicial_disturbance_clustered and clustered_method == 'gaussian':
+                                landscape[replicate] = events.gaussian_disturbance(
+                                    event_rng, landscape[replicate], p, q00, stats=stats)
+                            elif inicial_disturbance_clustered and clustered_method == 'checkerboard':
+                                landscape[replicate] = events.checkerboard_disturbance(
+                                    event_rng, landscape[replicate], p, q00, neighbor_index, stats=stats,
+                                    **clustered_options)
+                            elif inicial_disturbance_clustered:
+                                landscape[replicate] = events.clustered_disturbance(
+                                    event_rng, landscape[replicate], p, q00, neighbor_index, stats=stats,
+                                    **clustered_options)
+                            else:
+                                landscape[replicate] = events.random_disturbance(event_rng, landscape[replicate], p)
+                            if stats:
+                                profiler.record_stats(CLUSTERED_METHODS[clustered_method], **stats)
+
+        for replicate in due:
+            upcoming[replicate] = next(timelines[replicate], (None, ()))
+
+        # campo médio
+        with timer('campo_medio', gen):
+            if extinct:
+                nat_cm = exo_cm = np.zeros(replicates)
+            else:
+                previous_nat_cm, previous_exo_cm = nat_cm, exo_cm
+                nat_cm, native_population = events.campo_medio(native_population)
+                exo_cm, exotic_population = events.campo_medio(exotic_population)
+
+        # store
+        with timer('record', gen):
+            history.record(gen, state(native_population), state(exotic_population), state(landscape),
+                           state(nat_cm), state(exo_cm))
+
+        # término antecipado
+        if termination is not None and not extinct:
+            if gen >= last_invasion and not np.any(nat_cm) and not np.any(exo_cm):
+                history.termination = {'generation': gen, 'reason': 'extinction'}
+                if termination == 'stop':
+                    break
+                extinct = True
+
+            elif gen > last_event:
+                unchanged = (np.array_equal(landscape, previous_landscape)
+                             and np.all(np.abs(nat_cm - previous_nat_cm) <= tolerance * np.maximum(previous_nat_cm, 1))
+                             and np.all(np.abs(exo_cm - previous_exo_cm) <= tolerance * np.maximum(previous_exo_cm, 1)))
+                stable = stable + 1 if unchanged else 0
+
+                if stable >= patience:
+                    history.termination = {'generation': gen, 'reason': 'steady_state'}
+                    if termination == 'fast_forward':
+                        for remaining in range(gen + 1, total_num_generations):
+                            history.record(remaining, state(native_population), state(exotic_population),
+                                           state(landscape), state(nat_cm), state(exo_cm))
+                    break
+
+        if gen >= last_event:
+            previous_landscape = landscape.copy()
+
+        # checkpoint
+        if checkpoint_path is not None and gen % checkpoint_every == 0:
+            history_arrays, history_counters = history.checkpoint(checkpoint_path)
+            checkpoint.save_checkpoint(
+                checkpoint_path,
+                {'landscape': landscape, 'native_population': native_population,
+                 'exotic_population': exotic_population, 'nat_cm': nat_cm, 'exo_cm': exo_cm,
+                 'previous_landscape': previous_landscape, **history_arrays},
+                {'gen': gen, 'stable': stable, 'extinct': extinct, 'history': history_counters,
+                 'arguments': arguments, 'ensemble': ensemble,
+                 'rng_states': [checkpoint.rng_state(replicate_rng) for replicate_rng in rngs],
+                 'schedules': [{'gens': replicate_schedule.gens.tolist(), 'events': replicate_schedule.events}
+                               for replicate_schedule in schedules]})
+
+    history.close()
+
+    return history
+
+
+def resume(checkpoint_path, profiler=None):
+    """
+    retoma uma simulação a partir do checkpoint gravado por simulate
+
+    A simulação continua da geração seguinte à do checkpoint, com os mesmos argumentos,
+    cronogramas e estados dos geradores, e dá exatamente o mesmo resultado da simulação
+    sem interrupção. Novos checkpoints continuam sendo gravados em checkpoint_path.
+
+    Parameters
+    ----------
+    checkpoint_path : str
+        arquivo .npz do checkpoint
+
+    profiler : profiling.Profiler, optional
+        ver simulate. The default is None.
+
+    Returns
+    -------
+    history : HistoryRecorder or StreamingWriter
+        histórico completo da simulação (ver simulate)
+
+    """
+
+    arrays, info = checkpoint.load_checkpoint(checkpoint_path)
+    arguments = dict(info['arguments'], matrix_size=tuple(info['arguments']['matrix_size']))
+
+    rngs = [checkpoint.restore_rng(state) for state in info['rng_states']]
+    schedules = [EventSchedule(np.array(schedule['gens'], dtype=int), [tuple(names) for names in schedule['events']])
+                 for schedule in info['schedules']]
+    if not info['ensemble']:
+        rngs, schedules = rngs[0], schedules[0]
+
+    return simulate(rngs, schedules, **arguments, profiler=profiler, resume_state=(arrays, info))
+
+
+class ScenarioParser(argparse.ArgumentParser):
+    """ parser dos cenários: valida as combinações dos argumentos comuns """
+
+    def parse_args(self, args=None, namespace=None):
+        args = super().parse_args(args, namespace)
+        if args.resume and args.checkpoint is None:
+            self.error("--resume requer --checkpoint")
+
+        return args
+
+
+def scenario_parser(description, q00=0.9):
+    """
+    parser de linha de comando comum aos cenários, com os valores dos exemplos como padrão
+
+    Parameters
+    ----------
+    description : str
+        descrição do cenário
+
+    q00 : float, optional
+        valor padrão de --q00. The default is 0.9.
+
+    Returns
+    -------
+    parser : ScenarioParser
+        parser com os argumentos comuns; cada cenário acrescenta os seus
+
+    """
+
+    parser = ScenarioParser(description=description)
+    parser.add_argument('--p', type=float, default=0.5, help='intensidade do distúrbio')
+    parser.add_argument('--native-migration-rate', type=float, default=0.2)
+    parser.add_argument('--exotic-migration-rate', type=float, default=0.2)
+    parser.add_argument('--clustered', action='store_true', help='distúrbio inicial agregado')
+    parser.add_argument('--q00', type=float, default=q00, help='usado com --clustered')
+    parser.add_argument('--clustered-method', default='hiebeler', choices=CLUSTERED_METHODS,
+                        help='gerador do distúrbio agregado')
+    parser.add_argument('--temperature', type=float, default=0.0,
+                        help='com --clustered, temperatura inicial do recozimento simulado do gerador agregado')
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--migration-mode', default='individual', choices=events.MIGRATION_MODES)
+    parser.add_argument('--output-dir', default=None, help='grava o histórico em disco durante a execução')
+    parser.add_argument('--seed', type=int, nargs='+', default=[12456789],
+                        help='uma seed, ou várias para o modo ensemble')
+    parser.add_argument('--landscape-library', default=None,
+                        help='diretório da biblioteca de paisagens agregadas (ver landscapes.py)')
+    parser.add_argument('--termination', default=None, choices=TERMINATIONS,
+                        help='término antecipado na extinção ou no estado estacionário')
+    parser.add_argument('--checkpoint', default=None, help='arquivo de checkpoint (ver simulation.resume)')
+    parser.add_argument('--checkpoint-every', type=int, default=10)
+    parser.add_argument('--resume', action='store_true', help='continua a simulação gravada em --checkpoint')
+    parser.add_argument('--population-dtype', default='float64', choices=POPULATION_DTYPES)
+    parser.add_argument('--landscape-dtype', default='int64', help='tipo inteiro da paisagem, por exemplo int8')
+    parser.add_argument('--packed-landscape', action='store_true', help='paisagem do histórico com 2 bits por patch')
+
+    return parser
+
+
+def scenario_arguments(args):
+    """ argumentos comuns das funções scenario_N a partir da linha de comando """
+
+    return dict(p=args.p, native_migration_rate=args.native_migration_rate,
+                exotic_migration_rate=args.exotic_migration_rate,
+                inicial_disturbance_clustered=args.clustered, q00=args.q00 if args.clustered else None,
+                total_num_generations=args.generations, migration_mode=args.migration_mode,
+                output_dir=args.output_dir, seed=args.seed if len(args.seed) > 1 else args.seed[0],
+                landscape_library=args.landscape_library, termination=args.termination,
+                checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every,
+                population_dtype=args.population_dtype, landscape_dtype=args.landscape_dtype,
+                packed_landscape=args.packed_landscape,
+                clustered_options={'temperature': args.temperature} if args.temperature else None,
+                clustered_method=args.clustered_method)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Fluxos independentes de números aleatórios por réplica, ponto da varredura e tipo de evento.
+
+Com um único Generator por simulação, cada sorteio depende de todos os anteriores: mudar
+a ordem dos eventos, simular várias réplicas em lote ou dividir uma varredura entre
+processos muda os resultados. RandomStreams deriva da SeedSequence raiz (a seed) um
+fluxo para cada (ponto da varredura, réplica, tipo de evento), identificado pelo
+spawn_key e não pela ordem em que os fluxos são criados: o cronograma, o distúrbio
+inicial, a invasão, a restauração, o distúrbio e a migração de cada espécie sorteiam
+cada um do seu próprio gerador. Os resultados são os mesmos numa varredura serial, em
+processos ou em lote (ver sweep.run_sweep).
+
+simulation.simulate aceita um RandomStreams (ou um por réplica) no lugar do Generator;
+com um Generator, todos os eventos continuam sorteando dele, como antes.
+
+Exemplo:
+    rng = RandomStreams(12456789)
+    schedule = simulation.scenario_schedule(4, rng['schedule'], 100, rec_time=5, total_dist=5)
+    simulation.simulate(rng, schedule, 0.5, 0.2, 0.2, pr=0.2)
+
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+# tipos de evento com fluxo próprio; a posição de cada um entra no spawn_key, então novos
+# tipos só podem ser acrescentados no fim
+EVENTS = ('schedule', 'initial_disturbance', 'invasion', 'restoration', 'disturbance', 'native_migration',
+          'exotic_migration')
+
+
+def point_key(params):
+    """ inteiro de 32 bits que identifica um ponto da varredura (hash dos parâmetros) """
+
+    description = json.dumps(params, sort_keys=True)
+
+    return int(hashlib.sha256(description.encode()).hexdigest()[:8], 16)
+
+
+class RandomStreams:
+    """
+    geradores independentes de uma réplica, um por tipo de evento, criados sob demanda
+
+    Parameters
+    ----------
+    seed : int
+        entropia da SeedSequence raiz
+
+    point : int, optional
+        ponto da varredura (ver point_key). The default is 0.
+
+    replicate : int, optional
+        réplica do ponto. The default is 0.
+
+    """
+
+    def __init__(self, seed, point=0, replicate=0):
+        self.seed = int(seed)
+        self.point = int(point)
+        self.replicate = int(replicate)
+        self.generators = {}
+
+    def __getitem__(self, event):
+        """ gerador do tipo de evento event (ver EVENTS) """
+
+        if event not in self.generators:
+            sequence = np.random.SeedSequence(self.seed, spawn_key=(self.point, self.replicate, EVENTS.index(event)))
+            self.generators[event] = np.random.default_rng(sequence)
+
+        return self.generators[event]
+
+    def __repr__(self):
+        return f'RandomStreams(seed={self.seed}, point={self.point}, replicate={self.replicate})'
+
+    def state(self):
+        """ estado serializável (JSON): a identificação e o estado de cada gerador já usado """
+
+        return {'seed': self.seed, 'point': self.point, 'replicate': self.replicate,
+                'generators': {event: generator.bit_generator.state for event, generator in self.generators.items()}}
+
+    @classmethod
+    def from_state(cls, state):
+        """ RandomStreams no estado state (ver state) """
+
+        streams = cls(state['seed'], state['point'], state['replicate'])
+        for event, generator_state in state['generators'].items():
+            streams[event].bit_generator.state = generator_state
+
+        return streams
+
+
+def replicate_streams(seed, replicates, point=0):
+    """ fluxos de replicates réplicas derivados de uma única seed """
+
+    return [RandomStreams(seed, point, replicate) for replicate in range(replicates)]
+
+
+def event_rng(rng, event):
+    """ gerador usado por event: o fluxo do evento com RandomStreams, o próprio rng com um Generator """
+
+    return rng[event] if isinstance(rng, RandomStreams) else rng
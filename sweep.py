@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Varredura de parâmetros dos cenários em paralelo, com cache de resultados.
+
+Cada ponto da grade é simulado para cada seed e o resultado é salvo em
+cache_dir/<hash>.npz, onde o hash identifica (cenário, parâmetros, seed, versão do
+código). Rodar de novo uma varredura interrompida ou ampliada só calcula os pontos
+que ainda não estão no cache.
+
+Cada (ponto, seed) sorteia de fluxos próprios (streams.RandomStreams, com o ponto
+identificado por streams.point_key): o resultado é o mesmo com a varredura serial
+(--workers 1), em processos ou em lote (--batch, as seeds de cada ponto simuladas juntas
+no modo ensemble de simulation.simulate).
+
+Uso:
+    python sweep.py --scenario 2 --grid grade.json --seeds 1 2 3 --workers 8
+    python sweep.py --scenario 2 --grid grade.json --seeds 1 2 3 --workers 8 --batch
+
+grade.json mapeia cada parâmetro a uma lista de valores, por exemplo
+    {"p": [0.3, 0.5], "pr": [0.2], "rec_time": [5, 10],
+     "native_migration_rate": [0.1, 0.2], "exotic_migration_rate": [0.2]}
+
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import events
+import simulation
+from streams import RandomStreams, point_key
+
+# diretório padrão do cache de resultados
+CACHE_DIR = 'sweep_cache'
+
+# módulos cujo código determina os resultados (entram na versão do código)
+SOURCE_MODULES = ('checkpoint.py', 'compiled.py', 'events.py', 'neighbors.py', 'history.py', 'landscapes.py',
+                  'precision.py', 'profiling.py', 'simulation.py', 'streams.py', 'sweep.py')
+
+# parâmetros que definem o cronograma de eventos (ver simulation.scenario_schedule)
+SCHEDULE_PARAMETERS = ('rec_time', 'dist_time', 'total_dist')
+
+
+def code_version():
+    """ hash do código-fonte dos módulos que determinam os resultados """
+
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    for module in SOURCE_MODULES:
+        with open(os.path.join(directory, module), 'rb') as handle:
+            digest.update(handle.read())
+
+    return digest.hexdigest()
+
+
+def expand_grid(grid):
+    """
+    expande a grade de parâmetros em uma lista de pontos
+
+    Parameters
+    ----------
+    grid : dict
+        {nome do parâmetro: lista de valores}
+
+    Returns
+    -------
+    points : list of dict
+        todas as combinações de valores, na ordem alfabética dos parâmetros
+
+    """
+
+    names = sorted(grid)
+
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def result_key(scenario, params, seed, version, keep_grids=False, landscape_library=None):
+    """
+    hash que identifica o resultado de um ponto da varredura
+
+    inclui o backend dos eventos e se a paisagem agregada vem da biblioteca de paisagens
+    (gerada com outro fluxo aleatório), mas não o diretório da biblioteca
+    """
+
+    description = json.dumps({'scenario': scenario, 'params': params, 'seed': seed,
+                              'code_version': version, 'keep_grids': keep_grids,
+                              'backend': events.BACKEND,
+                              'landscape_library': landscape_library is not None}, sort_keys=True)
+
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def run_point(scenario, params, seed, path, keep_grids=False, landscape_library=None):
+    """
+    simula um ponto da varredura e salva o resultado em path
+
+    O arquivo contém as séries 'mean_nat', 'mean_exo' e 'generations', o estado final
+    ('final_natpop', 'final_exopop', 'final_landscape'), as grades completas caso
+    keep_grids e os parâmetros do ponto em 'params' (JSON). Com landscape_library (diretório),
+    a paisagem agregada inicial é lida da biblioteca de paisagens ou gerada e guardada nela.
+
+    """
+
+    return run_batch(scenario, params, [seed], [path], keep_grids, landscape_library)[0]
+
+
+def run_batch(scenario, params, seeds, paths, keep_grids=False, landscape_library=None):
+    """
+    simula as seeds de um ponto da varredura em lote e salva o resultado de cada seed
+
+    Cada seed é uma réplica do modo ensemble de simulation.simulate, com os fluxos
+    RandomStreams(seed, point_key(ponto)) e o seu próprio cronograma; o arquivo de cada
+    seed é idêntico ao de run_point. Ver run_point.
+
+    """
+
+    params = dict(params)
+    point = point_key({'scenario': scenario, **params})
+    schedule_params = {name: params.pop(name) for name in SCHEDULE_PARAMETERS if name in params}
+
+    rngs = [RandomStreams(seed, point) for seed in seeds]
+    total_num_generations = params.get('total_num_generations', 100)
+    schedules = [simulation.scenario_schedule(scenario, rng['schedule'], total_num_generations, **schedule_params)
+                 for rng in rngs]
+    history = simulation.simulate(rngs, schedules, **params, landscape_library=landscape_library,
+                                  landscape_seed=list(seeds))
+
+    mean_nat, mean_exo, natpop, exopop, landscape, generations = history.arrays()
+    for replicate, (seed, path) in enumerate(zip(seeds, paths)):
+        result = {
+            'mean_nat': mean_nat[replicate],
+            'mean_exo': mean_exo[replicate],
+            'generations': generations,
+            'final_natpop': natpop[replicate, -1],
+            'final_exopop': exopop[replicate, -1],
+            'final_landscape': landscape[replicate, -1],
+            'params': json.dumps({'scenario': scenario, 'seed': seed, **params, **schedule_params}),
+        }
+        if keep_grids:
+            result.update(natpop=natpop[replicate], exopop=exopop[replicate], landscape=landscape[replicate])
+
+        temp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temp_path, **result)
+        os.replace(temp_path, path)
+
+    return list(paths)
+
+
+def run_sweep(scenario, grid, seeds, cache_dir=CACHE_DIR, workers=None, keep_grids=False, landscape_library=None,
+              batch=False):
+    """
+    executa a varredura em um pool de processos, reaproveitando o cache
+
+    Parameters
+    ----------
+    scenario : int
+        número do cenário (1 a 4)
+
+    grid : dict
+        {nome do parâmetro: lista de valores}; parâmetros de simulation.simulate e
+        rec_time, dist_time, total_dist
+
+    seeds : sequence of int
+        seeds simuladas em cada ponto
+
+    cache_dir : str, optional
+        diretório do cache de resultados. The default is CACHE_DIR.
+
+    workers : int, optional
+        número de processos. The default is None (número de CPUs).
+
+    keep_grids : bool, optional
+        se as grades de todas as gerações são guardadas. The default is False.
+
+    landscape_library : str, optional
+        diretório da biblioteca de paisagens agregadas (ver landscapes.py), compartilhada pelos
+        pontos com os mesmos p, q00 e seed. The default is None (sem biblioteca).
+
+    batch : bool, optional
+        se as seeds pendentes de cada ponto são simuladas juntas, em lote (ver run_batch), com
+        os mesmos resultados; incompatível com termination, que no lote vale para todas as
+        réplicas. The default is False.
+
+    Returns
+    -------
+    results : list of (dict, int, str)
+        (parâmetros, seed, arquivo do resultado) de cada ponto
+
+    """
+
+    if batch and grid.get('termination', [None]) != [None]:
+        raise ValueError("o modo em lote não é compatível com termination")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    version = code_version()
+
+    results = []
+    pending = []
+    for params in expand_grid(grid):
+        for seed in seeds:
+            path = os.path.join(cache_dir, f'{result_key(scenario, params, seed, version, keep_grids, landscape_library)}.npz')
+            results.append((params, seed, path))
+            if not os.path.exists(path):
+                pending.append((params, seed, path))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if batch:
+                points = {}
+                for params, seed, path in pending:
+                    _, point_seeds, paths = points.setdefault(json.dumps(params, sort_keys=True), (params, [], []))
+                    point_seeds.append(seed)
+                    paths.append(path)
+                futures = [pool.submit(run_batch, scenario, params, point_seeds, paths, keep_grids, landscape_library)
+                           for params, point_seeds, paths in points.values()]
+            else:
+                futures = [pool.submit(run_point, scenario, params, seed, path, keep_grids, landscape_library)
+                           for params, seed, path in pending]
+            for future in futures:
+                future.result()
+
+    return results
+
+
+def load_result(path):
+    """ lê o resultado de um ponto da varredura """
+
+    with np.load(path) as stored:
+        result = {name: stored[name] for name in stored.files}
+    result['params'] = json.loads(str(result['params']))
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', type=int, required=True, choices=(1, 2, 3, 4))
+    parser.add_argument('--grid', required=True, help='arquivo JSON {parâmetro: [valores]}')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[12456789])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--keep-grids', action='store_true')
+    parser.add_argument('--landscape-library', default=None, help='diretório da biblioteca de paisagens')
+    parser.add_argument('--batch', action='store_true', help='simula as seeds de cada ponto em lote')
+    args = parser.parse_args()
+
+    with open(args.grid) as handle:
+        grid = json.load(handle)
+
+    results = run_sweep(args.scenario, grid, args.seeds, args.cache, args.workers, args.keep_grids,
+                        args.landscape_library, args.batch)
+    for params, seed, path in results:
+        print(path, seed, json.dumps(params, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
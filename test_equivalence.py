@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Resultados que precisam ser idênticos, bit a bit, entre caminhos de execução diferentes.
+
+Uso:
+    python -m pytest -q test_equivalence.py
+
+"""
+
+import numpy as np
+import pytest
+
+import simulation
+import sweep
+from history import load_stream
+from profiling import Profiler
+from streams import RandomStreams
+
+MATRIX_SIZE = (50, 50)
+GENERATIONS = 20
+
+
+def scenario_3(rng, **options):
+    """ cenário 3 (restauração e distúrbio periódicos) a 50 x 50, com o histórico em memória """
+
+    schedule = simulation.scenario_schedule(3, rng['schedule'], GENERATIONS, rec_time=5, dist_time=7)
+
+    return simulation.simulate(rng, schedule, 0.4, 0.2, 0.2, pr=0.2, matrix_size=MATRIX_SIZE,
+                               total_num_generations=GENERATIONS, **options)
+
+
+def assert_same_history(expected, actual):
+    for name in ('stored_mean_nat', 'stored_mean_exo', 'stored_natpop', 'stored_exopop', 'stored_landscape',
+                 'stored_generations'):
+        np.testing.assert_array_equal(getattr(expected, name), getattr(actual, name), err_msg=name)
+
+
+# com ocupação máxima 1.0 o caminho esparso é usado em todas as gerações
+@pytest.mark.parametrize('sparse_occupancy', [simulation.SPARSE_OCCUPANCY, 1.0])
+@pytest.mark.parametrize('migration_mode', ['individual', 'multinomial', 'mean_field'])
+def test_sparse_matches_dense(migration_mode, sparse_occupancy):
+    dense = scenario_3(RandomStreams(12456789), migration_mode=migration_mode, sparse_occupancy=0)
+    sparse = scenario_3(RandomStreams(12456789), migration_mode=migration_mode, sparse_occupancy=sparse_occupancy)
+
+    assert_same_history(dense, sparse)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_at(generation):
+    """ callback do Profiler que interrompe a simulação ao fim da gravação da geração generation """
+
+    def callback(gen, name, seconds, allocated):
+        if gen == generation and name == 'record':
+            raise Interrupted
+
+    return callback
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_resume_matches_uninterrupted(tmp_path, streaming):
+    def run(directory, profiler=None):
+        directory.mkdir(exist_ok=True)
+        output = {'output_dir': str(directory / 'stream')} if streaming else {}
+        return scenario_3(RandomStreams(12456789), migration_mode='multinomial',
+                          checkpoint_path=str(directory / 'checkpoint.npz'), checkpoint_every=5,
+                          profiler=profiler, **output)
+
+    expected = run(tmp_path / 'a')
+
+    with pytest.raises(Interrupted):
+        run(tmp_path / 'b', Profiler(callbacks=[interrupt_at(13)]))
+    resumed = simulation.resume(str(tmp_path / 'b' / 'checkpoint.npz'))
+
+    if streaming:
+        expected, resumed = load_stream(str(tmp_path / 'a' / 'stream')), load_stream(str(tmp_path / 'b' / 'stream'))
+        for name in ('natpop', 'exopop', 'landscape', 'grid_generations', 'mean_nat', 'mean_exo', 'mean_generations'):
+            np.testing.assert_array_equal(expected[name], resumed[name], err_msg=name)
+    else:
+        assert_same_history(expected, resumed)
+
+
+def test_sweep_serial_processes_and_batch_agree(tmp_path):
+    grid = {'p': [0.3, 0.5], 'pr': [0.2], 'rec_time': [5], 'total_dist': [3], 'native_migration_rate': [0.2],
+            'exotic_migration_rate': [0.2], 'total_num_generations': [GENERATIONS],
+            'matrix_size': [list(MATRIX_SIZE)], 'migration_mode': ['multinomial']}
+    seeds = [1, 2]
+
+    results = {}
+    for name, options in (('serial', {'workers': 1}), ('processes', {'workers': 2}),
+                          ('batch', {'workers': 1, 'batch': True})):
+        points = sweep.run_sweep(4, grid, seeds, str(tmp_path / name), **options)
+        results[name] = [sweep.load_result(path) for _, _, path in points]
+
+    assert len(results['serial']) == 2 * len(seeds)
+    for name in ('processes', 'batch'):
+        assert len(results[name]) == len(results['serial'])
+        for expected, actual in zip(results['serial'], results[name]):
+            assert expected['params'] == actual['params']
+            for key in expected:
+                if key != 'params':
+                    np.testing.assert_array_equal(expected[key], actual[key], err_msg=f'{name}: {key}')